@@ -0,0 +1,128 @@
+from collections import OrderedDict
+from .MunsellInterpolate import munsell_interpolate, munsell_interpolate_coverage, munsell_swatch
+from .MunsellInverse import rgb_to_munsell
+from .MunsellTable import add_table_listener, remove_table_listener
+
+def _frozen(result):
+    # Tuples all the way down, so cached results cannot be changed.
+    if isinstance(result, (list, tuple)):
+        return tuple(_frozen(x) for x in result)
+    return result
+
+
+class InterpolationCache:
+    """Bounded LRU cache in front of an interpolation function.
+
+    Keys are the coordinates rounded to multiples of 1 / precision, so
+    coordinates closer than that share the color of whichever was looked
+    up first. A miss evaluates the function at the coordinates as given,
+    which keeps repeated lookups of the same point exact.
+
+    Results come back as tuples, nested ones included, so a caller
+    cannot change an entry other callers get.
+
+    The cache empties itself when use_dataset() switches the table.
+    """
+
+    def __init__(self, function=munsell_interpolate, maxsize=8192, precision=4096):
+        self.function = function
+        self.maxsize = maxsize
+        self.precision = precision
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        add_table_listener(self.invalidate)
+
+    def __call__(self, i, j, k):
+        precision = self.precision
+        try:
+            key = (round(i * precision), round(j * precision), round(k * precision))
+        except (ValueError, OverflowError):
+            # NaN and infinite coordinates are left to the function.
+            return _frozen(self.function(i, j, k))
+        return self._lookup(key, i, j, k)
+
+    def _lookup(self, key, *args):
+        # The entry for key, or self.function(*args) stored under it.
+        # Subclasses only build their own keys.
+        entries = self.entries
+        result = entries.get(key)
+        if result is not None:
+            entries.move_to_end(key)
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = entries[key] = _frozen(self.function(*args))
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+            self.evictions += 1
+        return result
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def invalidate(self, table=None):
+        """Drop every entry, keeping the counters. Called with the new table on a dataset switch."""
+        self.entries.clear()
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evictions = 0
+
+    def close(self):
+        """Stop listening for table changes, for caches that are thrown away"""
+        remove_table_listener(self.invalidate)
+        self.entries.clear()
+
+
+coverage_cache = InterpolationCache(munsell_interpolate_coverage)
+
+def munsell_interpolate_coverage_cached(i, j, k):
+    """munsell_interpolate_coverage through the shared coverage_cache"""
+    return coverage_cache(i, j, k)
+
+swatch_cache = InterpolationCache(munsell_swatch)
+
+def munsell_swatch_cached(i, j, k):
+    """munsell_swatch through the shared swatch_cache"""
+    return swatch_cache(i, j, k)
+
+
+class ConversionCache(InterpolationCache):
+    """Bounded LRU cache in front of an RGB to Munsell conversion.
+
+    Keys are 0-1 sRGB colors packed into 24 bits, 8 per channel, so
+    colors that agree in 8 bits share the coordinates of whichever was
+    converted first. The default size holds the colors a painter cycles
+    through, the docker's history and the swatches picked from its
+    grids, many times over.
+    """
+
+    def __init__(self, function=rgb_to_munsell, maxsize=256):
+        # Keys are packed channels, so there is no coordinate precision.
+        super().__init__(function, maxsize, precision=None)
+
+    def __call__(self, rgb):
+        try:
+            r, g, b = (min(max(round(c * 255), 0), 255) for c in rgb)
+        except (ValueError, OverflowError):
+            return _frozen(self.function(rgb))
+        return self._lookup(r << 16 | g << 8 | b, rgb)
+
+
+conversion_cache = ConversionCache()
+
+def rgb_to_munsell_cached(rgb):
+    """rgb_to_munsell through the shared conversion_cache"""
+    return conversion_cache(rgb)
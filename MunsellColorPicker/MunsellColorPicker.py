@@ -1,6 +1,9 @@
 import math
 import os
 from .MunsellInterpolate import *
+from .MunsellCache import *
+from .MunsellInverse import *
+from .MunsellTable import add_table_listener, remove_table_listener
 from krita import * # type: ignore
 from krita import ManagedColor # type: ignore
 from PyQt5.QtCore import QSize, QTimer, Qt
@@ -9,7 +12,6 @@ from PyQt5.QtWidgets import (
 )
 from PyQt5.QtCore import pyqtSignal
 from PyQt5.QtGui import QColor, QClipboard, QTextCursor
-import colorsys
 
 DOCKER_TITLE = 'Munsell Color Picker'
 
@@ -179,6 +181,18 @@ class DockerTemplate(DockWidget): # type: ignore
 
         self.updateColorInfo()
         self.updateModeVisibility()
+
+        # Regenerate the grids when a script switches the Munsell dataset,
+        # and stop listening once Krita deletes the docker
+        listener = self.onTableChanged
+        add_table_listener(listener)
+        self.destroyed.connect(lambda *_: remove_table_listener(listener))
+
+    def onTableChanged(self, table):
+        self.cached_light_chroma_colors = []
+        self.cached_hue_chroma_colors = []
+        self.cached_light_hue_colors = []
+        self.updateModeVisibility()
         
     def updateModeVisibility(self):
         is_lightchroma = self.mode_lightchroma.isChecked()
@@ -282,10 +296,9 @@ class DockerTemplate(DockWidget): # type: ignore
             g_norm = fg_components[1]
             b_norm = fg_components[0]
 
-            # Use HLS to get the lightness
-            hue_float, _, _ = colorsys.rgb_to_hls(r_norm, g_norm, b_norm)
-            hue_scaled = hue_float * 40.0
-            self.cached_light_chroma_colors = self.GetLightChromaColors(hue_scaled)
+            # Munsell hue of the foreground color
+            hue, _, _ = rgb_to_munsell_cached((r_norm, g_norm, b_norm))
+            self.cached_light_chroma_colors = self.GetLightChromaColors(hue)
             
             self.renderLightChromaGrid()
 
@@ -310,26 +323,18 @@ class DockerTemplate(DockWidget): # type: ignore
 
     def GetLightChromaColors(self, hue):
         all_colors = []
+        table = get_table()
 
-        for j in range(1, 15):  # Lightness levels
+        for j in range(1, table.values - 1):  # Lightness levels
             row_colors = []
-            for k in range(26):  # Chroma steps
-                color = munsell_interpolate(hue, j, k)
-
-                # Stop if color is clearly invalid or black placeholder
-                if not color_charted(color) or color == [0, 0, 0]:
-                    break
-
-                color_norm = [c / 255.0 for c in color]
-
-                if not color_valid(color_norm):
-                    break
-
-                srgb = srgb_coords(color_norm)
-                if sum(srgb) <= 30:  # very dark or clipped
+            for k in range(table.chromas):  # Chroma steps
+                # Blend the charted chips only, so colors next to the edge of
+                # the chart keep their brightness, and stop at the edge.
+                color, coverage = munsell_interpolate_coverage_cached(hue, j, k)
+                if coverage < MIN_COVERAGE or not color_displayable(color):
                     break
 
-                row_colors.append(color_norm)
+                row_colors.append([c / 255.0 for c in color])
 
             if row_colors:
                 all_colors.append(row_colors)
@@ -339,24 +344,15 @@ class DockerTemplate(DockWidget): # type: ignore
     def GetHueChromaColors(self, light):
         # this is filling a like circle not a list
         all_colors = []
+        table = get_table()
 
-        for i in range(40):  # Hues (0–39)
+        for i in range(table.hues):  # Hues (0–39)
             hue_colors = []
 
-            for k in range(26):  # Chroma
-                color = munsell_interpolate(i, light, k)
-
-                if not color_charted(color) or color == [0, 0, 0]:
-                    break
-
-                color_norm = [c / 255.0 for c in color]
+            for k in range(chroma_limit(i, light)):  # Displayable chroma
+                color_norm, level = munsell_swatch_cached(i, light, k)
 
-                if not color_valid(color_norm):
-                    break
-
-                srgb = srgb_coords(color_norm)
-
-                if sum(srgb) <= 30:
+                if level <= 30:  # black or very dark
                     break
 
                 hue_colors.append(color_norm)
@@ -367,21 +363,16 @@ class DockerTemplate(DockWidget): # type: ignore
     
     def GetLightHueColors(self, chroma):
         all_colors = []
+        table = get_table()
 
-        for j in range(1, 15):  # Lightness (Value)
+        for j in range(1, table.values - 1):  # Lightness (Value)
             row_colors = []
-            for i in range(40):  # Hue
-                color = munsell_interpolate(i, j, chroma)
+            for i in range(table.hues):  # Hue
+                color_norm, level = munsell_swatch_cached(i, j, chroma)
 
-                if not color_charted(color) or color == [0, 0, 0]:
+                if level == 0:  # black placeholder
                     continue
-
-                color_norm = [c / 255.0 for c in color]
-                if not color_valid(color_norm):
-                    break
-
-                srgb = srgb_coords(color_norm)
-                if sum(srgb) <= 30:
+                if level <= 30:  # very dark
                     break
 
                 row_colors.append(color_norm)
@@ -401,13 +392,10 @@ class DockerTemplate(DockWidget): # type: ignore
             g_norm = fg_components[1]
             b_norm = fg_components[0]
 
-            # Use HLS to extract chroma proxy (based on saturation)
-            h, l, s = colorsys.rgb_to_hls(r_norm, g_norm, b_norm)
-            # Clamp saturation to index range [0–25] for 26 discrete chroma steps
-            # Then normalize index back to [0–1]
-            chroma_index = min(int(s * 25), 25) / 25
+            # Munsell chroma of the foreground color
+            _, _, chroma = rgb_to_munsell_cached((r_norm, g_norm, b_norm))
 
-            self.cached_light_hue_colors = self.GetLightHueColors(chroma_index)
+            self.cached_light_hue_colors = self.GetLightHueColors(chroma)
             self.renderLightHueGrid()
         except Exception as e:
             self.showError(f"Light-Hue Error: {str(e)}")
@@ -439,9 +427,9 @@ class DockerTemplate(DockWidget): # type: ignore
             g_norm = fg_components[1]
             b_norm = fg_components[0]
 
-            # Use HLS to get the lightness
-            _, _, light_float = colorsys.rgb_to_hls(r_norm, g_norm, b_norm)
-            lightness_index = max(1, min(round(light_float * 10), 10))  # Clamp
+            # Munsell value of the foreground color, on a row the grid shows
+            _, value, _ = rgb_to_munsell_cached((r_norm, g_norm, b_norm))
+            lightness_index = max(1, min(round(value), get_table().values - 2))
             self.cached_hue_chroma_colors = self.GetHueChromaColors(lightness_index)
 
             self.renderHueChromaGrid()
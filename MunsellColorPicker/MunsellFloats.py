@@ -1,4 +1,5 @@
 NaN = float('nan')
+CHECKSUM = '9b96fd3939127679'
 #Munsell floats in current python file
 Munsell = [
   [
@@ -14022,11 +14023,7 @@ Munsell = [
       [0.02947, -0.11321, 0.35779],
       [0.0328, -0.19004, 0.43619],
       [0.05852, -0.42565, 0.60357],
-      [
-        6818951067985612247171489268462713307136.0,
-        -28579011420959997633630618917906133828377555064064475906133030661631042248729032627380563155615744.0,
-        36408709152543715848479499926220031655936.0
-      ],
+      [6.818951067985612e+39, -2.8579011420959998e+97, 3.6408709152543716e+40],
       [NaN, NaN, NaN],
       [NaN, NaN, NaN],
       [NaN, NaN, NaN],
@@ -1,41 +1,800 @@
 import math
-from .MunsellFloats import *
+from .MunsellTable import NaN, QUANT_BITS, QUANT_OFFSET, QUANT_SCALE, add_table_listener, get_table, quantize_table
 from .Utils import *
 
+def __getattr__(name):
+    if name == 'Munsell':
+        return get_table()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 def munsell_entry_exists(hue, value, chroma):
+    table = get_table()
     try:
-        triple = Munsell[int(hue)][int(value)][int(chroma)]
-        return color_charted(triple)
+        cell = table.cell_index(int(hue), int(value), int(chroma))
     except (IndexError, ValueError):
         return False
+    return table.charted[cell >> 3] >> (cell & 7) & 1 == 1
+
+def munsell_entries_exist(hues, values, chromas):
+    """munsell_entry_exists over parallel sequences of coordinates, as a list of bools.
+
+    With NumPy this is the mask of _batch_points, which also reports
+    infinite coordinates as uncharted; without it, a loop over the
+    bitset.
+    """
+    try:
+        valid = _batch_points(hues, values, chromas)[1]
+    except ImportError:
+        pass
+    else:
+        return valid.tolist()
+    table = get_table()
+    charted = table.charted
+    cell_index = table.cell_index
+    ans = []
+    for hue, value, chroma in zip(hues, values, chromas):
+        try:
+            cell = cell_index(int(hue), int(value), int(chroma))
+        except (IndexError, ValueError):
+            ans.append(False)
+            continue
+        ans.append(charted[cell >> 3] >> (cell & 7) & 1 == 1)
+    return ans
+
+def _charted(table, i, j, k):
+    # munsell_entry_exists without the calls: int() truncates and indices
+    # wrap like they did on the nested lists.
+    hues = table.hues
+    values = table.values
+    chromas = table.chromas
+    try:
+        ti = int(i)
+        tj = int(j)
+        tk = int(k)
+    except ValueError:
+        return False
+    if not (-hues <= ti < hues and -values <= tj < values and -chromas <= tk < chromas):
+        return False
+    return tk % chromas < table.runs[(ti % hues) * values + tj % values]
+
+def _blend(table, i, j, k):
+    # The trilinear blend at a charted (i, j, k) as unclamped 0-1 floats
+    # (r, g, b), shared by munsell_interpolate, munsell_interpolate_float
+    # and munsell_swatch.
+    hues = table.hues
+    values = table.values
+    chromas = table.chromas
+    runs = table.runs
+
+    # Only charted chromas are stored: a row's chromas 0 .. run - 1 start
+    # at data[starts[row] * 3] and corners past the run are uncharted,
+    # which adds nothing, as do corners with zero weight. Each corner is
+    # fetched once and the corners are summed in the same order as the
+    # original eight-term expression, so results are bit-identical.
+    data = table.data
+    starts = table.starts
+    i0 = math.floor(i)
+    j0 = math.floor(j)
+    k0 = math.floor(k)
+    a1 = i - i0
+    b1 = j - j0
+    c1 = k - k0
+    h0 = (i0 % hues) * values
+    v0 = j0 % values
+    s0 = k0 % chromas
+
+    # Integer coordinates are the common case in the grids. On the lattice
+    # the only corner with weight is the cell itself; with one or two
+    # fractional coordinates the blend collapses to 2 or 4 corners whose
+    # weights, being multiplied by 1.0, are the same floats as before.
+    if not a1 and not b1 and not c1:
+        o = (starts[h0 + v0] + s0) * 3
+        return data[o], data[o + 1], data[o + 2]
+
+    h1 = ((i0 + 1) % hues) * values
+    v1 = j0 + 1
+    if v1 < 0:
+        v1 += values
+    upper = v1 < values
+    s1 = k0 + 1
+    if s1 < 0:
+        s1 += chromas
+    a0 = 1 - a1
+    b0 = 1 - b1
+    c0 = 1 - c1
+    r = g = b = 0.0
+
+    if (not a1) + (not b1) + (not c1) == 2:
+        # One fractional coordinate: the floor corner and its neighbour
+        # along that axis.
+        row = h0 + v0
+        if a1:
+            w0, w1, row1, s = a0, a1, h1 + v0, s0
+        elif b1:
+            w0, w1, row1, s = b0, b1, (h0 + v1) if upper else -1, s0
+        else:
+            w0, w1, row1, s = c0, c1, row, s1
+        if s0 < runs[row]:
+            o = (starts[row] + s0) * 3
+            r += w0 * data[o]; g += w0 * data[o + 1]; b += w0 * data[o + 2]
+        if row1 >= 0 and s < runs[row1]:
+            o = (starts[row1] + s) * 3
+            r += w1 * data[o]; g += w1 * data[o + 1]; b += w1 * data[o + 2]
+
+    elif not a1 or not b1 or not c1:
+        # One integer coordinate: the four corners of a face, in the
+        # original order. A row of -1 marks a corner past the top value.
+        if not c1:
+            corners = ((a0 * b0, h0 + v0, s0), (a1 * b0, h1 + v0, s0),
+                       (a0 * b1, (h0 + v1) if upper else -1, s0),
+                       (a1 * b1, (h1 + v1) if upper else -1, s0))
+        elif not b1:
+            corners = ((a0 * c0, h0 + v0, s0), (a1 * c0, h1 + v0, s0),
+                       (a0 * c1, h0 + v0, s1), (a1 * c1, h1 + v0, s1))
+        else:
+            corners = ((b0 * c0, h0 + v0, s0), (b1 * c0, (h0 + v1) if upper else -1, s0),
+                       (b0 * c1, h0 + v0, s1), (b1 * c1, (h0 + v1) if upper else -1, s1))
+        for w, row, s in corners:
+            if row >= 0 and s < runs[row]:
+                o = (starts[row] + s) * 3
+                r += w * data[o]; g += w * data[o + 1]; b += w * data[o + 2]
+
+    else:
+        w = a0 * b0 * c0
+        if w:
+            row = h0 + v0
+            if s0 < runs[row]:
+                o = (starts[row] + s0) * 3
+                r += w * data[o]; g += w * data[o + 1]; b += w * data[o + 2]
+        w = a1 * b0 * c0
+        if w:
+            row = h1 + v0
+            if s0 < runs[row]:
+                o = (starts[row] + s0) * 3
+                r += w * data[o]; g += w * data[o + 1]; b += w * data[o + 2]
+        w = a0 * b1 * c0
+        if w and upper:
+            row = h0 + v1
+            if s0 < runs[row]:
+                o = (starts[row] + s0) * 3
+                r += w * data[o]; g += w * data[o + 1]; b += w * data[o + 2]
+        w = a1 * b1 * c0
+        if w and upper:
+            row = h1 + v1
+            if s0 < runs[row]:
+                o = (starts[row] + s0) * 3
+                r += w * data[o]; g += w * data[o + 1]; b += w * data[o + 2]
+        w = a0 * b0 * c1
+        if w:
+            row = h0 + v0
+            if s1 < runs[row]:
+                o = (starts[row] + s1) * 3
+                r += w * data[o]; g += w * data[o + 1]; b += w * data[o + 2]
+        w = a1 * b0 * c1
+        if w:
+            row = h1 + v0
+            if s1 < runs[row]:
+                o = (starts[row] + s1) * 3
+                r += w * data[o]; g += w * data[o + 1]; b += w * data[o + 2]
+        w = a0 * b1 * c1
+        if w and upper:
+            row = h0 + v1
+            if s1 < runs[row]:
+                o = (starts[row] + s1) * 3
+                r += w * data[o]; g += w * data[o + 1]; b += w * data[o + 2]
+        w = a1 * b1 * c1
+        if w and upper:
+            row = h1 + v1
+            if s1 < runs[row]:
+                o = (starts[row] + s1) * 3
+                r += w * data[o]; g += w * data[o + 1]; b += w * data[o + 2]
+
+    return r, g, b
 
 def munsell_interpolate(i, j, k):
-    
-    if not munsell_entry_exists(i,j,k):
-        return [0,0,0]
-        
+    table = get_table()
+    hues = table.hues
+    values = table.values
+    chromas = table.chromas
+
+    # _charted and the lattice case of _blend, inlined, as most grid
+    # points are uncharted or integer.
+    try:
+        ti = int(i)
+        tj = int(j)
+        tk = int(k)
+    except ValueError:
+        return [0, 0, 0]
+    if not (-hues <= ti < hues and -values <= tj < values and -chromas <= tk < chromas):
+        return [0, 0, 0]
+    row = (ti % hues) * values + tj % values
+    s = tk % chromas
+    if s >= table.runs[row]:
+        return [0, 0, 0]
+    if ti == i and tj == j and tk == k:
+        data = table.data
+        o = (table.starts[row] + s) * 3
+        r = data[o]; g = data[o + 1]; b = data[o + 2]
+    else:
+        r, g, b = _blend(table, i, j, k)
+    r = round(r * 255)
+    g = round(g * 255)
+    b = round(b * 255)
+    return [0 if r < 0 else 255 if r > 255 else r,
+            0 if g < 0 else 255 if g > 255 else g,
+            0 if b < 0 else 255 if b > 255 else b]
+
+def munsell_interpolate_float(i, j, k):
+    """The blend munsell_interpolate rounds, as unclamped 0-1 floats.
+
+    Returns ([r, g, b], in_gamut). in_gamut is True when every channel
+    lies within [0, 1], so the color needs no clamping, and False for
+    out-of-gamut colors and for uncharted points, which give
+    [0.0, 0.0, 0.0].
+    """
+    table = get_table()
+    if not _charted(table, i, j, k):
+        return [0.0, 0.0, 0.0], False
+    r, g, b = _blend(table, i, j, k)
+    return [r, g, b], 0.0 <= r <= 1.0 and 0.0 <= g <= 1.0 and 0.0 <= b <= 1.0
+
+def munsell_swatch(i, j, k):
+    """A grid swatch from the blend munsell_interpolate rounds, clamped and quantized in one step.
+
+    Returns (color, level): the color as 0-1 floats on the 8-bit grid,
+    the way the grids store it, and the sum of its 8-bit channels, which
+    is 0 for black and uncharted points, for the grids' darkness checks.
+    """
+    table = get_table()
+    if not _charted(table, i, j, k):
+        return [0.0, 0.0, 0.0], 0
+    r, g, b = _blend(table, i, j, k)
+    r = round(r * 255)
+    g = round(g * 255)
+    b = round(b * 255)
+    r = 0 if r < 0 else 255 if r > 255 else r
+    g = 0 if g < 0 else 255 if g > 255 else g
+    b = 0 if b < 0 else 255 if b > 255 else b
+    return [r / 255, g / 255, b / 255], r + g + b
+
+
+_chroma_limits = None
+
+def chroma_limits():
+    """Displayable chroma steps for every integer hue and value.
+
+    limits[hue * table.values + value] is the first chroma step whose
+    swatch is black or too dark to show, so steps below it are the ones
+    the grids display. Built once per table checksum.
+    """
+    global _chroma_limits
+    table = get_table()
+    if _chroma_limits is None or _chroma_limits[0] != table.checksum:
+        limits = bytearray(table.hues * table.values)
+        for row, run in enumerate(table.runs):
+            # Past the charted run every swatch is black, and the last
+            # chroma has no neighbour to blend with, so the grids stop
+            # before it.
+            i, j = divmod(row, table.values)
+            k = 0
+            while k < min(run, table.chromas - 1) and color_displayable(munsell_interpolate(i, j, k)):
+                k += 1
+            limits[row] = k
+        _chroma_limits = (table.checksum, limits)
+    return _chroma_limits[1]
+
+def _drop_chroma_limits(table):
+    global _chroma_limits
+    _chroma_limits = None
+
+add_table_listener(_drop_chroma_limits)
+
+def chroma_limit(hue, value):
+    """Displayable chroma steps at an integer value.
+
+    Exact for integer hues. Between two hues the blended swatches can run
+    past either neighbour's limit, so a fractional hue gets the larger of
+    the two as an upper bound and callers still check the swatches.
+    """
+    table = get_table()
+    limits = chroma_limits()
+    i0 = int(math.floor(hue))
+    limit = limits[(i0 % table.hues) * table.values + value]
+    if hue != i0:
+        limit = max(limit, limits[((i0 + 1) % table.hues) * table.values + value])
+    return limit
+
+
+_quantized = None
+
+def get_quantized_table():
+    """uint16 fixed point copy of the current table, made on first use"""
+    global _quantized
+    table = get_table()
+    if _quantized is None or _quantized[0] != table.checksum:
+        _quantized = (table.checksum, quantize_table(table))
+    return _quantized[1]
+
+def _drop_quantized(table):
+    global _quantized
+    _quantized = None
+
+add_table_listener(_drop_quantized)
+
+# Each axis weight has WEIGHT_BITS of precision, so a corner weight has
+# three times that and a blended value is scaled by 2 ** FIXED_SHIFT.
+WEIGHT_BITS = 12
+FIXED_SHIFT = 3 * WEIGHT_BITS + QUANT_BITS
+
+def munsell_interpolate_fixed(i, j, k, table=None):
+    """munsell_interpolate on a uint16 table, blending with integers only.
+
+    table defaults to get_quantized_table(), or pass one loaded from a
+    MunsellTable16.bin file. Results are within one 8-bit step of the
+    float kernel on every lattice and half-step point. Between them the
+    only larger differences are next to the two wildly out-of-gamut
+    cells whose values get clamped.
+    """
+    if table is None:
+        table = get_quantized_table()
+    try:
+        cell = table.cell_index(int(i), int(j), int(k))
+    except (IndexError, ValueError):
+        return [0, 0, 0]
+    if not table.is_charted(cell):
+        return [0, 0, 0]
+
+    data = table.data
+    runs = table.runs
+    starts = table.starts
     i0 = int(math.floor(i))
     j0 = int(math.floor(j))
     k0 = int(math.floor(k))
-    i1 = (i0 + 1) % 40
-    j1 = j0 + 1
-    k1 = k0 + 1
+    one = 1 << WEIGHT_BITS
+    a1 = int(round((i - i0) * one))
+    b1 = int(round((j - j0) * one))
+    c1 = int(round((k - k0) * one))
+    a0 = one - a1
+    b0 = one - b1
+    c0 = one - c1
+    h0 = (i0 % table.hues) * table.values
+    h1 = ((i0 + 1) % table.hues) * table.values
+    v0 = j0 % table.values
+    v1 = j0 + 1
+    if v1 < 0:
+        v1 += table.values
+    upper = v1 < table.values
+    s0 = k0 % table.chromas
+    s1 = k0 + 1
+    if s1 < 0:
+        s1 += table.chromas
+    # Uncharted corners count as 0.0, which is zero after removing the offset.
+    zero = QUANT_OFFSET * QUANT_SCALE
+    ans = [0, 0, 0]
+    for weight, row, chroma, present in (
+        (a0 * b0 * c0, h0 + v0, s0, True),
+        (a1 * b0 * c0, h1 + v0, s0, True),
+        (a0 * b1 * c0, h0 + v1, s0, upper),
+        (a1 * b1 * c0, h1 + v1, s0, upper),
+        (a0 * b0 * c1, h0 + v0, s1, True),
+        (a1 * b0 * c1, h1 + v0, s1, True),
+        (a0 * b1 * c1, h0 + v1, s1, upper),
+        (a1 * b1 * c1, h1 + v1, s1, upper),
+    ):
+        if weight and present and chroma < runs[row]:
+            offset = (starts[row] + chroma) * 3
+            ans[0] += weight * (data[offset] - zero)
+            ans[1] += weight * (data[offset + 1] - zero)
+            ans[2] += weight * (data[offset + 2] - zero)
+    half = 1 << (FIXED_SHIFT - 1)
+    return [max(0, min(255, (v * 255 + half) >> FIXED_SHIFT)) for v in ans]
+
+
+def _numpy():
+    # NumPy is optional, Krita does not always bundle it, and slow to
+    # import, so only the batch functions import it, on first use.
+    import numpy
+    return numpy
+
+_batch_arrays = None
+
+def batch_arrays():
+    """NumPy views of the current table: values as (n, 3), runs and row starts"""
+    global _batch_arrays
+    np = _numpy()
+    table = get_table()
+    if _batch_arrays is None or _batch_arrays[0] != table.checksum:
+        data = np.frombuffer(table.data, dtype=np.float64).reshape(-1, 3)
+        runs = np.frombuffer(bytes(table.runs), dtype=np.uint8).astype(np.intp)
+        starts = np.asarray(table.starts, dtype=np.intp)
+        _batch_arrays = (table.checksum, (data, runs, starts))
+    return _batch_arrays[1]
+
+def _drop_batch_arrays(table):
+    global _batch_arrays
+    _batch_arrays = None
+
+add_table_listener(_drop_batch_arrays)
+
+def _batch_points(hues, values, chromas):
+    """Broadcast coordinates flattened, with the munsell_entry_exists mask.
+
+    Returns the broadcast shape, the mask and the three coordinate arrays
+    with invalid points moved to 0 so they index safely.
+    """
+    np = _numpy()
+    table = get_table()
+    runs = batch_arrays()[1]
+    H, V, C = table.hues, table.values, table.chromas
+    i, j, k = np.broadcast_arrays(*(np.asarray(x, dtype=np.float64) for x in (hues, values, chromas)))
+    shape = i.shape
+    i, j, k = i.ravel(), j.ravel(), k.ravel()
+
+    # munsell_entry_exists: int() truncates, indices wrap like lists.
+    valid = np.isfinite(i) & np.isfinite(j) & np.isfinite(k)
+    ti, tj, tk = (np.where(valid, np.trunc(x), 0).astype(np.intp) for x in (i, j, k))
+    valid &= (-H <= ti) & (ti < H) & (-V <= tj) & (tj < V) & (-C <= tk) & (tk < C)
+    valid &= tk % C < runs[(ti % H) * V + tj % V]
+    return shape, valid, np.where(valid, i, 0), np.where(valid, j, 0), np.where(valid, k, 0)
+
+def munsell_interpolate_batch(hues, values, chromas):
+    """munsell_interpolate over arrays of coordinates.
+
+    The three arguments broadcast against each other. Returns a uint8
+    array of shape (..., 3) and a boolean array of shape (...) that is
+    False where munsell_interpolate would return [0, 0, 0] because the
+    floor cell is uncharted or a coordinate is NaN. Infinite coordinates,
+    which make munsell_interpolate raise, are reported as invalid too.
+    Results match munsell_interpolate exactly, including hue wraparound.
+    """
+    np = _numpy()
+    table = get_table()
+    data, runs, starts = batch_arrays()
+    H, V, C = table.hues, table.values, table.chromas
+    shape, valid, i, j, k = _batch_points(hues, values, chromas)
+
+    i0, j0, k0 = np.floor(i), np.floor(j), np.floor(k)
     a1 = i - i0
     b1 = j - j0
     c1 = k - k0
     a0 = 1 - a1
     b0 = 1 - b1
     c0 = 1 - c1
-    ans = [0.0, 0.0, 0.0]
-    for t in range(3):
-        ans[t] = (
-            mul(a0 * b0 * c0, Munsell[i0][j0][k0][t]) +
-            mul(a1 * b0 * c0, Munsell[i1][j0][k0][t]) +
-            mul(a0 * b1 * c0, Munsell[i0][j1][k0][t]) +
-            mul(a1 * b1 * c0, Munsell[i1][j1][k0][t]) +
-            mul(a0 * b0 * c1, Munsell[i0][j0][k1][t]) +
-            mul(a1 * b0 * c1, Munsell[i1][j0][k1][t]) +
-            mul(a0 * b1 * c1, Munsell[i0][j1][k1][t]) +
-            mul(a1 * b1 * c1, Munsell[i1][j1][k1][t])
-        )
-    return [int(max(0, min(255, round(v * 255)))) for v in ans]
+    i0, j0, k0 = i0.astype(np.intp), j0.astype(np.intp), k0.astype(np.intp)
+    h0 = (i0 % H) * V
+    h1 = ((i0 + 1) % H) * V
+    v0 = j0 % V
+    v1 = np.where(j0 + 1 < 0, j0 + 1 + V, j0 + 1)
+    s0 = k0 % C
+    s1 = np.where(k0 + 1 < 0, k0 + 1 + C, k0 + 1)
+    ans = np.zeros((len(i), 3))
+    # Same corners, weights and summation order as munsell_interpolate.
+    for weight, row, chroma, in_range in (
+        (a0 * b0 * c0, h0 + v0, s0, True),
+        (a1 * b0 * c0, h1 + v0, s0, True),
+        (a0 * b1 * c0, h0 + v1, s0, v1 < V),
+        (a1 * b1 * c0, h1 + v1, s0, v1 < V),
+        (a0 * b0 * c1, h0 + v0, s1, True),
+        (a1 * b0 * c1, h1 + v0, s1, True),
+        (a0 * b1 * c1, h0 + v1, s1, v1 < V),
+        (a1 * b1 * c1, h1 + v1, s1, v1 < V),
+    ):
+        row = np.where(in_range, row, 0)
+        present = valid & in_range & (chroma < runs[row])
+        corner = data[np.where(present, starts[row] + chroma, 0)]
+        ans += np.where(present[:, None], weight[:, None] * corner, 0.0)
+    rgb = np.clip(np.round(ans * 255), 0, 255).astype(np.uint8)
+    rgb[~valid] = 0
+    return rgb.reshape(shape + (3,)), valid.reshape(shape)
+
+
+def munsell_interpolate_tetrahedral(i, j, k):
+    """munsell_interpolate with tetrahedral instead of trilinear weights.
+
+    The cell around (i, j, k) is split into six tetrahedra along its
+    diagonal from the floor corner, and the point is blended from the four
+    corners of the one it falls in, so each channel takes four multiplies
+    instead of eight. Validity, wraparound and uncharted corners are
+    handled as in munsell_interpolate.
+    """
+    table = get_table()
+    hues = table.hues
+    values = table.values
+    chromas = table.chromas
+    runs = table.runs
+    try:
+        ti = int(i)
+        tj = int(j)
+        tk = int(k)
+    except ValueError:
+        return [0, 0, 0]
+    if not (-hues <= ti < hues and -values <= tj < values and -chromas <= tk < chromas):
+        return [0, 0, 0]
+    if tk % chromas >= runs[(ti % hues) * values + tj % values]:
+        return [0, 0, 0]
+
+    data = table.data
+    starts = table.starts
+    i0 = math.floor(i)
+    j0 = math.floor(j)
+    k0 = math.floor(k)
+    x = i - i0
+    y = j - j0
+    z = k - k0
+    h0 = (i0 % hues) * values
+    h1 = ((i0 + 1) % hues) * values
+    v0 = j0 % values
+    v1 = j0 + 1
+    if v1 < 0:
+        v1 += values
+    s0 = k0 % chromas
+    s1 = k0 + 1
+    if s1 < 0:
+        s1 += chromas
+    # Rows of the four hue and value corners, -1 past the top value.
+    r00 = h0 + v0
+    r10 = h1 + v0
+    r01 = h0 + v1 if v1 < values else -1
+    r11 = h1 + v1 if v1 < values else -1
+
+    # Walk from the floor corner to the opposite one, stepping along the
+    # axis with the largest fraction first.
+    if x >= y:
+        if y >= z:
+            corners = ((1 - x, r00, s0), (x - y, r10, s0), (y - z, r11, s0), (z, r11, s1))
+        elif x >= z:
+            corners = ((1 - x, r00, s0), (x - z, r10, s0), (z - y, r10, s1), (y, r11, s1))
+        else:
+            corners = ((1 - z, r00, s0), (z - x, r00, s1), (x - y, r10, s1), (y, r11, s1))
+    elif x >= z:
+        corners = ((1 - y, r00, s0), (y - x, r01, s0), (x - z, r11, s0), (z, r11, s1))
+    elif y >= z:
+        corners = ((1 - y, r00, s0), (y - z, r01, s0), (z - x, r01, s1), (x, r11, s1))
+    else:
+        corners = ((1 - z, r00, s0), (z - y, r00, s1), (y - x, r01, s1), (x, r11, s1))
+    r = g = b = 0.0
+    for w, row, s in corners:
+        if w and row >= 0 and s < runs[row]:
+            o = (starts[row] + s) * 3
+            r += w * data[o]; g += w * data[o + 1]; b += w * data[o + 2]
+
+    r = round(r * 255)
+    g = round(g * 255)
+    b = round(b * 255)
+    return [0 if r < 0 else 255 if r > 255 else r,
+            0 if g < 0 else 255 if g > 255 else g,
+            0 if b < 0 else 255 if b > 255 else b]
+
+
+def munsell_interpolate_tetrahedral_batch(hues, values, chromas):
+    """munsell_interpolate_tetrahedral over arrays, like munsell_interpolate_batch"""
+    np = _numpy()
+    table = get_table()
+    data, runs, starts = batch_arrays()
+    H, V, C = table.hues, table.values, table.chromas
+    shape, valid, i, j, k = _batch_points(hues, values, chromas)
+
+    i0, j0, k0 = np.floor(i), np.floor(j), np.floor(k)
+    x = i - i0
+    y = j - j0
+    z = k - k0
+    i0, j0, k0 = i0.astype(np.intp), j0.astype(np.intp), k0.astype(np.intp)
+    h0 = (i0 % H) * V
+    h1 = ((i0 + 1) % H) * V
+    v0 = j0 % V
+    v1 = np.where(j0 + 1 < 0, j0 + 1 + V, j0 + 1)
+    s0 = k0 % C
+    s1 = np.where(k0 + 1 < 0, k0 + 1 + C, k0 + 1)
+    r00 = h0 + v0
+    r10 = h1 + v0
+    r01 = np.where(v1 < V, h0 + v1, -1)
+    r11 = np.where(v1 < V, h1 + v1, -1)
+
+    # The six tetrahedra in the order munsell_interpolate_tetrahedral
+    # tests them, and the last three corners of each.
+    cases = [(x >= y) & (y >= z), (x >= y) & (y < z) & (x >= z), (x >= y) & (x < z),
+             (x < y) & (x >= z), (x < y) & (x < z) & (y >= z), (x < y) & (y < z)]
+    corners = (
+        (np.select(cases, [1 - x, 1 - x, 1 - z, 1 - y, 1 - y, 1 - z]), r00, s0),
+        (np.select(cases, [x - y, x - z, z - x, y - x, y - z, z - y]),
+         np.select(cases, [r10, r10, r00, r01, r01, r00]),
+         np.select(cases, [s0, s0, s1, s0, s0, s1])),
+        (np.select(cases, [y - z, z - y, x - y, x - z, z - x, y - x]),
+         np.select(cases, [r11, r10, r10, r11, r01, r01]),
+         np.select(cases, [s0, s1, s1, s0, s1, s1])),
+        (np.select(cases, [z, y, y, z, x, x]), r11, s1),
+    )
+    ans = np.zeros((len(i), 3))
+    for weight, row, chroma in corners:
+        present = valid & (weight != 0) & (row >= 0)
+        row = np.where(present, row, 0)
+        present &= chroma < runs[row]
+        corner = data[np.where(present, starts[row] + chroma, 0)]
+        ans += np.where(present[:, None], weight[:, None] * corner, 0.0)
+    rgb = np.clip(np.round(ans * 255), 0, 255).astype(np.uint8)
+    rgb[~valid] = 0
+    return rgb.reshape(shape + (3,)), valid.reshape(shape)
+
+
+def munsell_interpolate_coverage(i, j, k):
+    """Trilinear blend of the charted corners only, and how much of the blend they cover.
+
+    Returns ([r, g, b], coverage). coverage is the total trilinear weight
+    of the charted corners, from 0.0 to 1.0, and the color is their blend
+    divided by it, so points next to the edge of the chart keep the
+    brightness of the chips they touch instead of fading to black. Hue
+    wraps around; corners outside the value and chroma range count as
+    uncharted. With no charted corner the result is ([0, 0, 0], 0.0).
+    """
+    table = get_table()
+    hues = table.hues
+    values = table.values
+    chromas = table.chromas
+    runs = table.runs
+    data = table.data
+    starts = table.starts
+    try:
+        i0 = math.floor(i)
+        j0 = math.floor(j)
+        k0 = math.floor(k)
+    except (ValueError, OverflowError):
+        return [0, 0, 0], 0.0
+    a1 = i - i0
+    b1 = j - j0
+    c1 = k - k0
+    h0 = (i0 % hues) * values
+    h1 = ((i0 + 1) % hues) * values
+    r = g = b = coverage = 0.0
+    for hue, a in ((h0, 1 - a1), (h1, a1)):
+        for value, bw in ((j0, 1 - b1), (j0 + 1, b1)):
+            if not (a and bw and 0 <= value < values):
+                continue
+            row = hue + value
+            for chroma, c in ((k0, 1 - c1), (k0 + 1, c1)):
+                w = a * bw * c
+                if w and 0 <= chroma < runs[row]:
+                    o = (starts[row] + chroma) * 3
+                    r += w * data[o]; g += w * data[o + 1]; b += w * data[o + 2]
+                    coverage += w
+    if not coverage:
+        return [0, 0, 0], 0.0
+    r = round(r / coverage * 255)
+    g = round(g / coverage * 255)
+    b = round(b / coverage * 255)
+    return [0 if r < 0 else 255 if r > 255 else r,
+            0 if g < 0 else 255 if g > 255 else g,
+            0 if b < 0 else 255 if b > 255 else b], coverage
+
+# The grids stop where less than this much of a blend is charted, which
+# is where the nearest charted hue or value runs out.
+MIN_COVERAGE = 0.5
+
+def munsell_interpolate_normalized(i, j, k):
+    """The color from munsell_interpolate_coverage, without the coverage"""
+    return munsell_interpolate_coverage(i, j, k)[0]
+
+
+def munsell_interpolate_jacobian(i, j, k):
+    """The blend of munsell_interpolate_float and its derivatives.
+
+    Returns ([r, g, b], jacobian, charted) where jacobian[c][a] is the
+    derivative of channel c (0-1 scale) with respect to hue, value and
+    chroma (a = 0, 1, 2) in table steps. The blend is trilinear within a
+    cell, so the derivatives are exact there; on a cell boundary they
+    are the ones of the cell above. Uncharted corners count as zero, as
+    in the kernel. When the floor cell is uncharted, charted is False and
+    the color and jacobian are zero.
+    """
+    table = get_table()
+    hues = table.hues
+    values = table.values
+    chromas = table.chromas
+    runs = table.runs
+    zero = [0.0, 0.0, 0.0]
+    try:
+        ti = int(i)
+        tj = int(j)
+        tk = int(k)
+    except ValueError:
+        return zero, [zero[:], zero[:], zero[:]], False
+    if not (-hues <= ti < hues and -values <= tj < values and -chromas <= tk < chromas) \
+            or tk % chromas >= runs[(ti % hues) * values + tj % values]:
+        return zero, [zero[:], zero[:], zero[:]], False
+
+    data = table.data
+    starts = table.starts
+    i0 = math.floor(i)
+    j0 = math.floor(j)
+    k0 = math.floor(k)
+    a1 = i - i0
+    b1 = j - j0
+    c1 = k - k0
+    v1 = j0 + 1
+    if v1 < 0:
+        v1 += values
+    s1 = k0 + 1
+    if s1 < 0:
+        s1 += chromas
+    hue_rows = (((i0 % hues) * values, 1 - a1, -1.0), (((i0 + 1) % hues) * values, a1, 1.0))
+    value_rows = ((j0 % values, 1 - b1, -1.0), (v1, b1, 1.0))
+    color = [0.0, 0.0, 0.0]
+    jacobian = [[0.0, 0.0, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]]
+    # Corners in the kernel's order, so the color is bit-identical to it.
+    # Each weight a * b * c has derivative da * b * c along hue and so on,
+    # where da is -1 for the lower corner and +1 for the upper one.
+    for s, c, dc in ((k0 % chromas, 1 - c1, -1.0), (s1, c1, 1.0)):
+        for v, b, db in value_rows:
+            if v >= values:
+                continue
+            for h, a, da in hue_rows:
+                row = h + v
+                if s >= runs[row]:
+                    continue
+                o = (starts[row] + s) * 3
+                w = a * b * c
+                dw = (da * b * c, a * db * c, a * b * dc)
+                for channel in range(3):
+                    x = data[o + channel]
+                    if w:
+                        color[channel] += w * x
+                    d = jacobian[channel]
+                    d[0] += dw[0] * x
+                    d[1] += dw[1] * x
+                    d[2] += dw[2] * x
+    return color, jacobian, True
+
+def munsell_interpolate_jacobian_batch(hues, values, chromas):
+    """munsell_interpolate_jacobian over arrays of coordinates.
+
+    The arguments broadcast like munsell_interpolate_batch. Returns float
+    arrays of shape (..., 3) and (..., 3, 3) and the boolean charted mask.
+    """
+    np = _numpy()
+    table = get_table()
+    data, runs, starts = batch_arrays()
+    H, V, C = table.hues, table.values, table.chromas
+    shape, valid, i, j, k = _batch_points(hues, values, chromas)
+
+    i0, j0, k0 = np.floor(i), np.floor(j), np.floor(k)
+    a1 = i - i0
+    b1 = j - j0
+    c1 = k - k0
+    i0, j0, k0 = i0.astype(np.intp), j0.astype(np.intp), k0.astype(np.intp)
+    v1 = np.where(j0 + 1 < 0, j0 + 1 + V, j0 + 1)
+    s1 = np.where(k0 + 1 < 0, k0 + 1 + C, k0 + 1)
+    hue_rows = (((i0 % H) * V, 1 - a1, -1.0), (((i0 + 1) % H) * V, a1, 1.0))
+    value_rows = ((j0 % V, 1 - b1, -1.0), (v1, b1, 1.0))
+    color = np.zeros((len(i), 3))
+    jacobian = np.zeros((len(i), 3, 3))
+    for s, c, dc in ((k0 % C, 1 - c1, -1.0), (s1, c1, 1.0)):
+        for v, b, db in value_rows:
+            for h, a, da in hue_rows:
+                row = np.where(v < V, h + v, 0)
+                present = valid & (v < V) & (s < runs[row])
+                x = np.where(present[:, None], data[np.where(present, starts[row] + s, 0)], 0.0)
+                w = a * b * c
+                color += np.where((w != 0)[:, None], w[:, None] * x, 0.0)
+                dw = np.stack([da * b * c, a * db * c, a * b * dc], axis=1)
+                jacobian += x[:, :, None] * dw[:, None, :]
+    return color.reshape(shape + (3,)), jacobian.reshape(shape + (3, 3)), valid.reshape(shape)
+
+
+# Interpolation modes by name. Modules with other kernels register
+# theirs, so callers pick a mode without importing every kernel.
+DEFAULT_MODE = 'trilinear'
+
+_modes = {
+    DEFAULT_MODE: munsell_interpolate,
+    'tetrahedral': munsell_interpolate_tetrahedral,
+    'normalized': munsell_interpolate_normalized,
+}
+
+def register_mode(name, function):
+    """Make function(i, j, k) -> [r, g, b] available as get_interpolator(name)"""
+    _modes[name] = function
+
+def mode_names():
+    return list(_modes)
+
+def get_interpolator(mode=DEFAULT_MODE):
+    return _modes[mode]
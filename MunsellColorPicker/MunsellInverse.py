@@ -0,0 +1,455 @@
+import bisect
+import math
+from .MunsellInterpolate import munsell_interpolate_jacobian, munsell_interpolate_jacobian_batch
+from .MunsellTable import add_table_listener, get_table
+
+# sRGB (D65) to XYZ, and the D65 white point for CIELAB.
+SRGB_TO_XYZ = (
+    (0.4124564, 0.3575761, 0.1804375),
+    (0.2126729, 0.7151522, 0.0721750),
+    (0.0193339, 0.1191920, 0.9503041),
+)
+WHITE_D65 = (0.95047, 1.0, 1.08883)
+
+# Chips blended into the refined coordinates of a color.
+NEIGHBOURS = 4
+
+# Cell size, in CIELAB units, of the grid rgb_to_munsell_batch looks
+# chips up in. Smaller cells list fewer chips each but take longer to
+# build: at 8 a cell lists 28 chips on the median and the grid builds in
+# about the time brute force takes for 10000 colors.
+GRID_CELL = 8.0
+# Queries shorter than this are searched by brute force until the grid
+# has been built, so a few conversions do not pay for building it.
+GRID_ROWS = 2048
+
+
+def srgb_to_linear(c):
+    # Out of gamut table colors keep their sign, see tools/build_table.py.
+    sign = -1.0 if c < 0 else 1.0
+    c = abs(c)
+    if c <= 0.04045:
+        return sign * c / 12.92
+    return sign * ((c + 0.055) / 1.055) ** 2.4
+
+def srgb_to_lab(rgb):
+    """CIELAB (D65) of a 0-1 sRGB color"""
+    linear = [srgb_to_linear(c) for c in rgb]
+    xyz = [sum(m * c for m, c in zip(row, linear)) / white for row, white in zip(SRGB_TO_XYZ, WHITE_D65)]
+    f = [t ** (1 / 3) if t > 216 / 24389 else (24389 / 27 * t + 16) / 116 for t in xyz]
+    return (116 * f[1] - 16, 500 * (f[0] - f[1]), 200 * (f[1] - f[2]))
+
+
+class ChipIndex:
+    """KD-tree over the charted chips of a table in CIELAB.
+
+    Neutral chips are the same grey under every hue, so only hue 0's are
+    kept. The two wildly out-of-gamut cells are left out. Nodes are
+    (chip number, split axis, lower subtree, upper subtree) tuples.
+    The batch functions use a ChipGrid over the same chips instead,
+    built into grid on first use.
+    """
+
+    def __init__(self, table):
+        self.checksum = table.checksum
+        self.labs = []
+        self.coords = []
+        for hue, value, chroma, rgb in table.chips():
+            if (chroma == 0 and hue != 0) or any(abs(c) > 10 for c in rgb):
+                continue
+            self.labs.append(srgb_to_lab(rgb))
+            self.coords.append((hue, value, chroma))
+        self.root = self.build(list(range(len(self.labs))), 0)
+        self.grid = None
+
+    def build(self, chips, axis):
+        if not chips:
+            return None
+        chips.sort(key=lambda n: self.labs[n][axis])
+        middle = len(chips) // 2
+        following = (axis + 1) % 3
+        return (chips[middle], axis, self.build(chips[:middle], following),
+                self.build(chips[middle + 1:], following))
+
+    def nearest(self, lab, count=NEIGHBOURS):
+        """[(squared distance, chip number)] of the count chips nearest to lab, nearest first"""
+        labs = self.labs
+        found = []
+
+        def visit(node):
+            n, axis, lower, upper = node
+            chip = labs[n]
+            distance = (chip[0] - lab[0]) ** 2 + (chip[1] - lab[1]) ** 2 + (chip[2] - lab[2]) ** 2
+            if len(found) < count or distance < found[-1][0]:
+                bisect.insort(found, (distance, n))
+                del found[count:]
+            offset = lab[axis] - chip[axis]
+            near, far = (lower, upper) if offset < 0 else (upper, lower)
+            if near is not None:
+                visit(near)
+            # The far side can only hold closer chips if the split plane is closer.
+            if far is not None and (len(found) < count or offset * offset < found[-1][0]):
+                visit(far)
+
+        visit(self.root)
+        return found
+
+
+_index = None
+
+def chip_index():
+    """ChipIndex of the current table, built on first use"""
+    global _index
+    table = get_table()
+    if _index is None or _index.checksum != table.checksum:
+        _index = ChipIndex(table)
+    return _index
+
+def _drop_index(table):
+    global _index
+    _index = None
+
+add_table_listener(_drop_index)
+
+
+def blend_coords(coords, weights, hues):
+    """Weighted mean of (hue, value, chroma) table coordinates.
+
+    Hue goes round a circle and means nothing for greys, so it is
+    averaged as an angle weighted by chroma too.
+    """
+    total = sum(weights)
+    value = sum(w * c[1] for w, c in zip(weights, coords)) / total
+    chroma = sum(w * c[2] for w, c in zip(weights, coords)) / total
+    x = y = 0.0
+    for w, (hue, _, c) in zip(weights, coords):
+        angle = 2 * math.pi * hue / hues
+        x += w * c * math.cos(angle)
+        y += w * c * math.sin(angle)
+    if x or y:
+        hue = math.atan2(y, x) * hues / (2 * math.pi) % hues
+    else:
+        hue = coords[0][0]
+    return hue, value, chroma
+
+def rgb_to_munsell(rgb):
+    """Table coordinates (hue, value, chroma) of a 0-1 sRGB color.
+
+    The nearest charted chips in CIELAB are found in the ChipIndex and
+    their coordinates blended by inverse squared distance, so colors
+    between chips land between them. A color matching a chip gives
+    exactly its coordinates.
+    """
+    index = chip_index()
+    nearest = index.nearest(srgb_to_lab(rgb))
+    coords = [index.coords[n] for _, n in nearest]
+    if nearest[0][0] < 1e-12:
+        return tuple(float(c) for c in coords[0])
+    return blend_coords(coords, [1 / d for d, _ in nearest], get_table().hues)
+
+def _lab_batch(colors):
+    # The same conversion as srgb_to_lab, on an (n, 3) array.
+    import numpy as np
+    linear = np.where(np.abs(colors) <= 0.04045, colors / 12.92,
+                      np.sign(colors) * ((np.abs(colors) + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ np.array(SRGB_TO_XYZ).T / np.array(WHITE_D65)
+    f = np.where(xyz > 216 / 24389, np.cbrt(xyz), (24389 / 27 * xyz + 16) / 116)
+    return np.stack([116 * f[:, 1] - 16, 500 * (f[:, 0] - f[:, 1]), 200 * (f[:, 1] - f[:, 2])], axis=1)
+
+def _nearest_brute(labs, query, count):
+    # (chip numbers, squared distances) of the count chips nearest to each
+    # row of query, by brute force in chunks that keep the distance matrix
+    # small. The expanded form only ranks the chips; the distances of the
+    # nearest few are recomputed directly so exact matches are found as
+    # in rgb_to_munsell.
+    import numpy as np
+    norms = (labs ** 2).sum(axis=1)
+    near = np.empty((len(query), count), dtype=np.intp)
+    dist = np.empty((len(query), count))
+    for start in range(0, len(query), 1024):
+        q = query[start:start + 1024]
+        rank = norms[None, :] - 2 * q @ labs.T
+        n = np.argpartition(rank, count - 1, axis=1)[:, :count]
+        d = ((labs[n] - q[:, None, :]) ** 2).sum(axis=2)
+        order = np.argsort(d, axis=1)
+        near[start:start + 1024] = np.take_along_axis(n, order, axis=1)
+        dist[start:start + 1024] = np.take_along_axis(d, order, axis=1)
+    return near, dist
+
+
+class ChipGrid:
+    """Uniform grid over the sRGB cube in CIELAB, listing the chips that can be nearest in each cell.
+
+    A cell lists every chip that can be among the NEIGHBOURS nearest of
+    a point in it.     A point in a cell is at most h, half the cell diagonal, from its
+    centre, so its NEIGHBOURS-th nearest chip is at most d + h away,
+    where d is the NEIGHBOURS-th nearest distance from the centre. Only
+    chips within d + h of the cell can be nearer. candidates[cell] lists
+    its counts[cell] chips, padded with a chip number past the last
+    chip, whose CIELAB is infinitely far from everything.
+    """
+
+    def __init__(self, labs, cell=GRID_CELL, count=NEIGHBOURS):
+        import numpy as np
+        self.cell = cell
+        self.count = count
+        # The box of the sRGB cube, sampled along its edges and faces.
+        levels = np.linspace(0.0, 1.0, 33)
+        cube = np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), axis=-1).reshape(-1, 3)
+        cube = _lab_batch(cube[(cube == 0).any(axis=1) | (cube == 1).any(axis=1)])
+        self.low = cube.min(axis=0) - cell / 2
+        self.shape = np.ceil((cube.max(axis=0) + cell / 2 - self.low) / cell).astype(np.intp)
+        # Squared distances along each axis from every chip to every cell
+        # centre and cell: a cell's distances are the sums of its rows'.
+        centre = []
+        box = []
+        for axis, n in enumerate(self.shape):
+            lower = self.low[axis] + np.arange(n)[:, None] * cell
+            x = labs[None, :, axis]
+            centre.append((x - lower - cell / 2) ** 2)
+            box.append(np.maximum(np.maximum(lower - x, x - lower - cell), 0) ** 2)
+        half_diagonal = cell * np.sqrt(3) / 2
+        counts = []
+        pairs = []
+        for i in range(self.shape[0]):
+            plane = (centre[0][i] + centre[1][:, None, :] + centre[2][None, :, :]).reshape(-1, len(labs))
+            reach = np.sqrt(np.partition(plane, count - 1, axis=1)[:, count - 1]) + half_diagonal
+            plane = (box[0][i] + box[1][:, None, :] + box[2][None, :, :]).reshape(-1, len(labs))
+            inside = plane <= reach[:, None] ** 2
+            counts.append(inside.sum(axis=1))
+            pairs.append(np.nonzero(inside))
+        self.counts = np.concatenate(counts)
+        self.candidates = np.full((len(self.counts), self.counts.max()), len(labs), dtype=np.intp)
+        first = np.cumsum(self.counts) - self.counts
+        plane_cells = self.shape[1] * self.shape[2]
+        for i, (cells, chips) in enumerate(pairs):
+            cells = cells + i * plane_cells
+            self.candidates[cells, np.arange(len(cells)) - (first[cells] - first[i * plane_cells])] = chips
+        # The row past the last chip is infinitely far from everything.
+        self.labs = np.vstack([labs, np.full((1, 3), np.inf)])
+
+    def nearest(self, query, count):
+        """(chip numbers, squared distances) of the count nearest chips to each row of query, nearest first.
+
+        Rows outside the grid, and counts above the grid's, are searched
+        by brute force.
+        """
+        import numpy as np
+        labs = self.labs
+        near = np.empty((len(query), count), dtype=np.intp)
+        dist = np.empty((len(query), count))
+        with np.errstate(invalid='ignore'):
+            cells = np.floor((query - self.low) / self.cell)
+            inside = ((cells >= 0) & (cells < self.shape)).all(axis=1) & (count <= self.count)
+        outside = np.flatnonzero(~inside)
+        if len(outside):
+            near[outside], dist[outside] = _nearest_brute(labs[:-1], query[outside], count)
+        rows = np.flatnonzero(inside)
+        cells = np.ravel_multi_index(cells[rows].astype(np.intp).T, self.shape)
+        # Rows sorted by list length, so each block only reads as far into
+        # the lists as its longest one.
+        order = np.argsort(self.counts[cells], kind='stable')
+        rows = rows[order]
+        cells = cells[order]
+        for start in range(0, len(rows), 4096):
+            block = cells[start:start + 4096]
+            chips = self.candidates[block, :self.counts[block].max()]
+            q = query[rows[start:start + 4096]]
+            d = ((labs[chips] - q[:, None, :]) ** 2).sum(axis=2)
+            n = np.argpartition(d, count - 1, axis=1)[:, :count]
+            d = np.take_along_axis(d, n, axis=1)
+            n = np.take_along_axis(chips, n, axis=1)
+            sort = np.argsort(d, axis=1)
+            near[rows[start:start + 4096]] = np.take_along_axis(n, sort, axis=1)
+            dist[rows[start:start + 4096]] = np.take_along_axis(d, sort, axis=1)
+        return near, dist
+
+
+def _nearest_batch(index, query, count):
+    """(chip numbers, squared distances) of the count chips nearest to each row of query, nearest first"""
+    import numpy as np
+    if index.grid is None:
+        if len(query) < GRID_ROWS:
+            return _nearest_brute(np.array(index.labs), query, count)
+        index.grid = ChipGrid(np.array(index.labs))
+    return index.grid.nearest(query, count)
+
+def rgb_to_munsell_batch(colors):
+    """rgb_to_munsell over an (..., 3) array of 0-1 sRGB colors, giving (..., 3) coordinates"""
+    import numpy as np
+    index = chip_index()
+    hues = get_table().hues
+    colors = np.asarray(colors, dtype=np.float64)
+    shape = colors.shape[:-1]
+    near, dist = _nearest_batch(index, _lab_batch(colors.reshape(-1, 3)), NEIGHBOURS)
+    c = np.array(index.coords, dtype=np.float64)[near]
+    exact = dist[:, 0] < 1e-12
+    w = 1 / np.where(exact[:, None], 1.0, dist)
+    value = (w * c[:, :, 1]).sum(axis=1) / w.sum(axis=1)
+    chroma = (w * c[:, :, 2]).sum(axis=1) / w.sum(axis=1)
+    angle = 2 * np.pi * c[:, :, 0] / hues
+    x = (w * c[:, :, 2] * np.cos(angle)).sum(axis=1)
+    y = (w * c[:, :, 2] * np.sin(angle)).sum(axis=1)
+    hue = np.where((x != 0) | (y != 0), np.arctan2(y, x) * hues / (2 * np.pi) % hues, c[:, 0, 0])
+    out = np.where(exact[:, None], c[:, 0, :], np.stack([hue, value, chroma], axis=1))
+    return out.reshape(shape + (3,))
+
+# Newton iterations stop once every channel is within SOLVE_TOLERANCE of
+# the target on the 0-1 scale, a hundredth of an 8-bit step, or after
+# SOLVE_ITERATIONS steps.
+SOLVE_TOLERANCE = 1 / 25500
+SOLVE_ITERATIONS = 20
+# Levenberg damping added to the normal equations. It only matters where
+# a direction has no effect, like hue on a grey, and keeps steps there
+# from blowing up.
+SOLVE_DAMPING = 1e-9
+
+def nearest_chip(rgb):
+    """Table coordinates of the charted chip nearest to a 0-1 sRGB color in CIELAB"""
+    index = chip_index()
+    return tuple(float(c) for c in index.coords[index.nearest(srgb_to_lab(rgb), 1)[0][1]])
+
+def _clamp_coords(hue, value, chroma, table):
+    # Hue wraps; value and chroma stay on the table. The top value row
+    # is uncharted, so value stays below it.
+    return hue % table.hues, min(max(value, 0.0), table.values - 2.0), min(max(chroma, 0.0), table.chromas - 1.0)
+
+def _solve3(a, b):
+    """Solve the 3x3 system a x = b by Cramer's rule"""
+    (a00, a01, a02), (a10, a11, a12), (a20, a21, a22) = a
+    c0 = a11 * a22 - a12 * a21
+    c1 = a12 * a20 - a10 * a22
+    c2 = a10 * a21 - a11 * a20
+    det = a00 * c0 + a01 * c1 + a02 * c2
+    if not det:
+        return [0.0, 0.0, 0.0]
+    b0, b1, b2 = b
+    return [(b0 * c0 + b1 * (a02 * a21 - a01 * a22) + b2 * (a01 * a12 - a02 * a11)) / det,
+            (b0 * c1 + b1 * (a00 * a22 - a02 * a20) + b2 * (a02 * a10 - a00 * a12)) / det,
+            (b0 * c2 + b1 * (a01 * a20 - a00 * a21) + b2 * (a00 * a11 - a01 * a10)) / det]
+
+def _squared_error(target, color):
+    return sum((t - c) ** 2 for t, c in zip(target, color))
+
+def _newton(target, x, table):
+    color, jacobian, charted = munsell_interpolate_jacobian(*x)
+    error = _squared_error(target, color)
+    iterations = 0
+    while max(abs(t - c) for t, c in zip(target, color)) > SOLVE_TOLERANCE and iterations < SOLVE_ITERATIONS:
+        iterations += 1
+        difference = [t - c for t, c in zip(target, color)]
+        # Normal equations J^T J dx = J^T difference.
+        normal = [[sum(jacobian[c][p] * jacobian[c][q] for c in range(3)) + (SOLVE_DAMPING if p == q else 0.0)
+                   for q in range(3)] for p in range(3)]
+        gradient = [sum(jacobian[c][p] * difference[c] for c in range(3)) for p in range(3)]
+        step = _solve3(normal, gradient)
+        # No step crosses more than one cell at a time.
+        scale = min(1.0, 1.0 / max(1e-12, max(abs(s) for s in step)))
+        while scale > 1e-4:
+            trial = _clamp_coords(*(a + scale * s for a, s in zip(x, step)), table)
+            trial_color, trial_jacobian, trial_charted = munsell_interpolate_jacobian(*trial)
+            trial_error = _squared_error(target, trial_color)
+            if trial_charted and trial_error < error:
+                break
+            scale /= 2
+        else:
+            break  # no step improves on x
+        x, color, jacobian, error = trial, trial_color, trial_jacobian, trial_error
+    return x, max(abs(t - c) for t, c in zip(target, color)), iterations
+
+def solve_munsell(rgb, start=None):
+    """Fractional table coordinates where munsell_interpolate_float gives rgb.
+
+    Starts from the nearest chip, or from start, and takes damped
+    Gauss-Newton steps on the trilinear blend using the cell-local
+    Jacobian, halving a step whenever it would not reduce the error or
+    would land on an uncharted cell. A search that gets stuck, which
+    happens where the nearest chip sits on a fold of the solid, starts
+    over from the next nearest chips and the best result is kept.
+
+    Returns (coords, residual, converged, iterations): residual is the
+    largest channel error left on the 0-1 scale, converged tells whether
+    it got within SOLVE_TOLERANCE and iterations counts the steps of
+    every start. Colors outside the charted solid end at the closest
+    point the search reaches, unconverged.
+    """
+    table = get_table()
+    target = [float(c) for c in rgb]
+    if start is not None:
+        starts = [_clamp_coords(*start, table)]
+    else:
+        index = chip_index()
+        starts = [tuple(float(c) for c in index.coords[n]) for _, n in index.nearest(srgb_to_lab(target))]
+    best = None
+    total = 0
+    for x in starts:
+        x, residual, iterations = _newton(target, x, table)
+        total += iterations
+        if best is None or residual < best[1]:
+            best = x, residual
+        if residual <= SOLVE_TOLERANCE:
+            break
+    return best[0], best[1], best[1] <= SOLVE_TOLERANCE, total
+
+def solve_munsell_batch(colors):
+    """solve_munsell over an (..., 3) array of 0-1 sRGB colors.
+
+    Every color takes its Newton steps from the nearest chip at once, on
+    arrays. The few that get stuck are handed to solve_munsell, which
+    tries the other nearby chips. Returns (coords (..., 3), residual,
+    converged, iterations) arrays.
+    """
+    import numpy as np
+    table = get_table()
+    index = chip_index()
+    colors = np.asarray(colors, dtype=np.float64)
+    shape = colors.shape[:-1]
+    target = colors.reshape(-1, 3)
+    near, _ = _nearest_batch(index, _lab_batch(target), 1)
+    x = np.array(index.coords, dtype=np.float64)[near[:, 0]]
+    top = np.array([np.inf, table.values - 2.0, table.chromas - 1.0])
+
+    def evaluate(points):
+        color, jacobian, charted = munsell_interpolate_jacobian_batch(points[:, 0], points[:, 1], points[:, 2])
+        return color, jacobian, charted, ((target[rows] - color) ** 2).sum(axis=1)
+
+    rows = np.arange(len(x))
+    color, jacobian, _, error = evaluate(x)
+    iterations = np.zeros(len(x), dtype=np.intp)
+    stuck = np.zeros(len(x), dtype=bool)
+    for _ in range(SOLVE_ITERATIONS):
+        rows = np.flatnonzero((np.abs(target - color).max(axis=1) > SOLVE_TOLERANCE) & ~stuck)
+        if not len(rows):
+            break
+        iterations[rows] += 1
+        j = jacobian[rows]
+        normal = j.transpose(0, 2, 1) @ j + SOLVE_DAMPING * np.eye(3)
+        gradient = (j.transpose(0, 2, 1) @ (target[rows] - color[rows])[:, :, None])[:, :, 0]
+        step = np.linalg.solve(normal, gradient[:, :, None])[:, :, 0]
+        # No step crosses more than one cell at a time.
+        scale = np.minimum(1.0, 1.0 / np.maximum(1e-12, np.abs(step).max(axis=1)))
+        searching = np.ones(len(rows), dtype=bool)
+        while True:
+            searching &= scale > 1e-4
+            if not searching.any():
+                break
+            trial = x[rows] + scale[:, None] * step
+            trial[:, 0] %= table.hues
+            trial = np.clip(trial, 0.0, top)
+            trial_color, trial_jacobian, charted, trial_error = evaluate(trial)
+            accept = searching & charted & (trial_error < error[rows])
+            moved = rows[accept]
+            x[moved] = trial[accept]
+            color[moved] = trial_color[accept]
+            jacobian[moved] = trial_jacobian[accept]
+            error[moved] = trial_error[accept]
+            searching &= ~accept
+            scale = np.where(searching, scale / 2, scale)
+        stuck[rows[scale <= 1e-4]] = True
+    residual = np.abs(target - color).max(axis=1)
+    for n in np.flatnonzero(residual > SOLVE_TOLERANCE):
+        coords, residual[n], _, more = solve_munsell(target[n])
+        x[n] = coords
+        iterations[n] += more
+    return (x.reshape(shape + (3,)), residual.reshape(shape), (residual <= SOLVE_TOLERANCE).reshape(shape),
+            iterations.reshape(shape))
@@ -0,0 +1,202 @@
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from .MunsellInverse import solve_munsell, solve_munsell_batch
+from .MunsellLoader import BackgroundLoader, load_file, replacing
+from .MunsellTable import get_table
+
+INVERSE_LATTICE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'MunsellInverse.bin')
+
+# Samples per sRGB channel. Sample n sits at n / (size - 1) on the 0-1
+# scale, so 33 puts one every 8 steps of an 8-bit channel.
+INVERSE_LATTICE_SIZE = 33
+
+# 16 byte header: magic, format version, samples per channel and the
+# checksum of the table the samples came from. It is followed by three
+# little-endian float32 per sample, so the file can be memory-mapped.
+INVERSE_LATTICE_MAGIC = b'MNSR'
+INVERSE_LATTICE_VERSION = 1
+INVERSE_LATTICE_HEADER = struct.Struct('<4sHH8s')
+
+
+class InverseLattice:
+    """solve_munsell sampled on a grid over the sRGB cube.
+
+    Sample (r, g, b) is stored at data[((r * size + g) * size + b) * 3]
+    as chroma * cos(angle), chroma * sin(angle) and value, where angle
+    is the hue index as a fraction of a turn. Interpolating these instead
+    of (hue, value, chroma) goes smoothly across the R / RP seam and
+    through the greys, whose hue means nothing.
+    """
+
+    def __init__(self, data, size, hues, checksum, mapping=None):
+        self.data = data
+        self.size = size
+        self.hues = hues
+        self.checksum = checksum
+        self.mapping = mapping
+
+    def lookup(self, rgb):
+        """Table coordinates (hue, value, chroma) of a 0-1 sRGB color, trilinear between samples"""
+        data = self.data
+        last = self.size - 1
+        corners = []
+        for c in rgb:
+            t = min(max(c, 0.0), 1.0) * last
+            n = min(int(t), last - 1)
+            corners.append((n, t - n))
+        (r, fr), (g, fg), (b, fb) = corners
+        x = y = value = 0.0
+        for dr, wr in ((0, 1 - fr), (1, fr)):
+            for dg, wg in ((0, 1 - fg), (1, fg)):
+                for db, wb in ((0, 1 - fb), (1, fb)):
+                    w = wr * wg * wb
+                    if w:
+                        o = (((r + dr) * self.size + g + dg) * self.size + b + db) * 3
+                        x += w * data[o]
+                        y += w * data[o + 1]
+                        value += w * data[o + 2]
+        return _coords(x, y, value, self.hues)
+
+    def lookup_batch(self, colors):
+        """lookup over an (..., 3) array of 0-1 sRGB colors, giving (..., 3) coordinates"""
+        import numpy as np
+        size = self.size
+        samples = np.frombuffer(self.data, dtype=np.float32).reshape(size, size, size, 3)
+        colors = np.asarray(colors, dtype=np.float64)
+        t = np.clip(colors, 0.0, 1.0) * (size - 1)
+        n = np.minimum(t.astype(np.intp), size - 2)
+        f = t - n
+        out = np.zeros(colors.shape)
+        for dr in (0, 1):
+            wr = f[..., 0] if dr else 1 - f[..., 0]
+            for dg in (0, 1):
+                wg = f[..., 1] if dg else 1 - f[..., 1]
+                for db in (0, 1):
+                    wb = f[..., 2] if db else 1 - f[..., 2]
+                    out += (wr * wg * wb)[..., None] * samples[n[..., 0] + dr, n[..., 1] + dg, n[..., 2] + db]
+        x, y, value = out[..., 0], out[..., 1], out[..., 2]
+        hue = np.arctan2(y, x) * self.hues / (2 * np.pi) % self.hues
+        return np.stack([hue, value, np.hypot(x, y)], axis=-1)
+
+
+def _coords(x, y, value, hues):
+    hue = math.atan2(y, x) * hues / (2 * math.pi) % hues
+    return hue, value, math.hypot(x, y)
+
+def _sample(coords, hues):
+    hue, value, chroma = coords
+    angle = 2 * math.pi * hue / hues
+    return chroma * math.cos(angle), chroma * math.sin(angle), value
+
+
+def build_inverse_lattice(size=INVERSE_LATTICE_SIZE):
+    """Solve every sample for the current table, with solve_munsell_batch when NumPy is available.
+
+    Colors outside the charted solid get the closest coordinates the
+    solver reaches.
+    """
+    table = get_table()
+    levels = [n / (size - 1) for n in range(size)]
+    try:
+        import numpy as np
+    except ImportError:
+        data = array('f')
+        for r in levels:
+            for g in levels:
+                for b in levels:
+                    data.extend(_sample(solve_munsell((r, g, b))[0], table.hues))
+    else:
+        grid = np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), axis=-1)
+        coords = solve_munsell_batch(grid)[0]
+        angle = 2 * np.pi * coords[..., 0] / table.hues
+        samples = np.stack([coords[..., 2] * np.cos(angle), coords[..., 2] * np.sin(angle), coords[..., 1]], axis=-1)
+        data = array('f')
+        data.frombytes(samples.astype(np.float32).tobytes())
+    return InverseLattice(data, size, table.hues, table.checksum)
+
+
+def write_inverse_lattice(path, lattice):
+    data = array('f', lattice.data)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    header = INVERSE_LATTICE_HEADER.pack(INVERSE_LATTICE_MAGIC, INVERSE_LATTICE_VERSION, lattice.size,
+                                         bytes.fromhex(lattice.checksum))
+    with replacing(path) as f:
+        f.write(header)
+        data.tofile(f)
+
+
+def _read_header(path, blob):
+    magic, version, size, checksum = INVERSE_LATTICE_HEADER.unpack_from(blob)
+    if (magic != INVERSE_LATTICE_MAGIC or version != INVERSE_LATTICE_VERSION
+            or len(blob) != INVERSE_LATTICE_HEADER.size + size ** 3 * 3 * 4):
+        raise ValueError(f"{path} is not a Munsell inverse lattice file")
+    return size, checksum.hex()
+
+def read_inverse_lattice(path=INVERSE_LATTICE_FILE):
+    with open(path, 'rb') as f:
+        blob = f.read()
+    size, checksum = _read_header(path, blob)
+    data = array('f')
+    data.frombytes(blob[INVERSE_LATTICE_HEADER.size:])
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return InverseLattice(data, size, get_table().hues, checksum)
+
+def map_inverse_lattice(path=INVERSE_LATTICE_FILE):
+    """Memory-map the inverse lattice file read-only, see map_table"""
+    if sys.byteorder != 'little':
+        return read_inverse_lattice(path)
+    with open(path, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        size, checksum = _read_header(path, mapping)
+    except ValueError:
+        mapping.close()
+        raise
+    data = memoryview(mapping)[INVERSE_LATTICE_HEADER.size:].cast('f')
+    return InverseLattice(data, size, get_table().hues, checksum, mapping)
+
+
+def load_inverse_lattice(path=INVERSE_LATTICE_FILE, cache_dir=None):
+    """The mapped file if it was built from the current table, else the table's cached or a new lattice.
+
+    The shipped file is never written; see load_file.
+    """
+    return load_file(path, map_inverse_lattice, build_inverse_lattice, write_inverse_lattice, cache_dir)
+
+
+_loader = BackgroundLoader('MunsellInverseLattice', load_inverse_lattice)
+
+def start_inverse_lattice_build(path=INVERSE_LATTICE_FILE, cache_dir=None):
+    """Load or build the inverse lattice on a daemon thread unless it is ready or on its way"""
+    return _loader.start(path, cache_dir)
+
+def get_inverse_lattice(wait=False):
+    """The inverse lattice for the current table, or None while it is being built"""
+    return _loader.get(wait)
+
+
+def rgb_to_munsell_lattice(rgb):
+    """Table coordinates of a 0-1 sRGB color from the inverse lattice.
+
+    Until the lattice is loaded, which the first call starts in the
+    background, the color is solved with solve_munsell instead.
+    """
+    lattice = get_inverse_lattice()
+    if lattice is None:
+        start_inverse_lattice_build()
+        return solve_munsell(rgb)[0]
+    return lattice.lookup(rgb)
+
+def rgb_to_munsell_lattice_batch(colors):
+    """rgb_to_munsell_lattice over an (..., 3) array, falling back to solve_munsell_batch"""
+    lattice = get_inverse_lattice()
+    if lattice is None:
+        start_inverse_lattice_build()
+        return solve_munsell_batch(colors)[0]
+    return lattice.lookup_batch(colors)
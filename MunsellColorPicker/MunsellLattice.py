@@ -0,0 +1,126 @@
+import os
+import struct
+from .MunsellInterpolate import munsell_interpolate, munsell_interpolate_batch, register_mode
+from .MunsellLoader import BackgroundLoader, load_file, replacing
+from .MunsellTable import get_table
+
+LATTICE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'MunsellLattice.bin')
+
+# Samples per table step along hue, value and chroma. Every table cell is
+# a sample, so integer coordinates read back the engine's exact colors.
+LATTICE_STEPS = (4, 4, 2)
+
+# 32 byte header: magic, format version, the samples per step, the sample
+# counts along hue, value and chroma and the checksum of the table the
+# samples came from. It is followed by three bytes of RGB per sample.
+LATTICE_MAGIC = b'MNSD'
+LATTICE_VERSION = 1
+LATTICE_HEADER = struct.Struct('<4sHBBBx3I8s2x')
+
+
+class DenseLattice:
+    """munsell_interpolate sampled on a grid finer than the table.
+
+    Sample (h, v, c) holds the color at hue h / steps[0], value
+    v / steps[1] and chroma c / steps[2], as three bytes at
+    data[((h * values + v) * chromas + c) * 3]. Hue wraps around, value
+    and chroma run from 0 to the last table row and column.
+    """
+
+    def __init__(self, data, steps, hues, values, chromas, checksum):
+        self.data = data
+        self.steps = steps
+        self.hues = hues
+        self.values = values
+        self.chromas = chromas
+        self.checksum = checksum
+
+    def nearest(self, i, j, k):
+        """Color of the sample nearest to (i, j, k), [0, 0, 0] off the lattice"""
+        try:
+            h = round(i * self.steps[0]) % self.hues
+            v = round(j * self.steps[1])
+            c = round(k * self.steps[2])
+        except (ValueError, OverflowError):
+            return [0, 0, 0]
+        if not (0 <= v < self.values and 0 <= c < self.chromas):
+            return [0, 0, 0]
+        offset = ((h * self.values + v) * self.chromas + c) * 3
+        return list(self.data[offset:offset + 3])
+
+
+def lattice_shape(table, steps=LATTICE_STEPS):
+    return (table.hues * steps[0], (table.values - 1) * steps[1] + 1, (table.chromas - 1) * steps[2] + 1)
+
+
+def build_lattice(steps=LATTICE_STEPS):
+    """Sample the current table, with the batch kernel when NumPy is available"""
+    table = get_table()
+    hues, values, chromas = lattice_shape(table, steps)
+    try:
+        import numpy as np
+    except ImportError:
+        data = bytearray(hues * values * chromas * 3)
+        offset = 0
+        for h in range(hues):
+            for v in range(values):
+                for c in range(chromas):
+                    data[offset:offset + 3] = bytes(munsell_interpolate(h / steps[0], v / steps[1], c / steps[2]))
+                    offset += 3
+    else:
+        rgb, _ = munsell_interpolate_batch(np.arange(hues)[:, None, None] / steps[0],
+                                           np.arange(values)[None, :, None] / steps[1],
+                                           np.arange(chromas)[None, None, :] / steps[2])
+        data = bytearray(rgb.tobytes())
+    return DenseLattice(data, tuple(steps), hues, values, chromas, table.checksum)
+
+
+def write_lattice(path, lattice):
+    header = LATTICE_HEADER.pack(LATTICE_MAGIC, LATTICE_VERSION, *lattice.steps,
+                                 lattice.hues, lattice.values, lattice.chromas,
+                                 bytes.fromhex(lattice.checksum))
+    with replacing(path) as f:
+        f.write(header)
+        f.write(lattice.data)
+
+
+def read_lattice(path=LATTICE_FILE):
+    with open(path, 'rb') as f:
+        blob = f.read()
+    magic, version, sh, sv, sc, hues, values, chromas, checksum = LATTICE_HEADER.unpack_from(blob)
+    data = bytearray(blob[LATTICE_HEADER.size:])
+    if magic != LATTICE_MAGIC or version != LATTICE_VERSION or len(data) != hues * values * chromas * 3:
+        raise ValueError(f"{path} is not a Munsell lattice file")
+    return DenseLattice(data, (sh, sv, sc), hues, values, chromas, checksum.hex())
+
+
+def load_lattice(path=LATTICE_FILE, cache_dir=None):
+    """The lattice file if it was built from the current table, else the table's cached or a new lattice.
+
+    path is never written; see load_file.
+    """
+    return load_file(path, read_lattice, build_lattice, write_lattice, cache_dir)
+
+
+_loader = BackgroundLoader('MunsellLattice', load_lattice)
+
+def start_lattice_build(path=LATTICE_FILE, cache_dir=None):
+    """Load or build the lattice on a daemon thread unless it is ready or on its way"""
+    return _loader.start(path, cache_dir)
+
+def get_lattice(wait=False):
+    """The lattice for the current table, or None while it is being built"""
+    return _loader.get(wait)
+
+def munsell_interpolate_nearest(i, j, k):
+    """Nearest lattice sample, falling back to munsell_interpolate until the lattice is built.
+
+    The first call starts the build in the background.
+    """
+    lattice = _loader.value
+    if lattice is None or lattice.checksum != get_table().checksum:
+        start_lattice_build()
+        return munsell_interpolate(i, j, k)
+    return lattice.nearest(i, j, k)
+
+register_mode('nearest', munsell_interpolate_nearest)
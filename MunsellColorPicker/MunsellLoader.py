@@ -0,0 +1,110 @@
+import contextlib
+import os
+import struct
+import sys
+import threading
+from .MunsellTable import add_table_listener, get_table
+
+
+def _cache_dir():
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser(r'~\AppData\Local')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'MunsellColorPicker')
+
+# Files built for tables other than the shipped one go here, one per
+# table, so switching datasets back and forth rebuilds nothing.
+CACHE_DIR = _cache_dir()
+
+
+def cached_file(path, checksum, cache_dir=None):
+    """Where the file named like path is cached for the table with checksum, e.g. MunsellInverse-<checksum>.bin"""
+    name, extension = os.path.splitext(os.path.basename(path))
+    return os.path.join(cache_dir or CACHE_DIR, f"{name}-{checksum}{extension}")
+
+def load_file(path, read, build, write, cache_dir=None):
+    """read(path) if it was built from the current table, else the table's cached file, else build().
+
+    What build() returns is written to the table's cached file, so the
+    next start reads it instead of building again. path itself is only
+    ever read, and a cache that cannot be written is left alone.
+    """
+    checksum = get_table().checksum
+    cached = cached_file(path, checksum, cache_dir)
+    for candidate in (path, cached):
+        try:
+            value = read(candidate)
+        except (OSError, ValueError, struct.error):
+            continue
+        if value.checksum == checksum:
+            return value
+    value = build()
+    try:
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        write(cached, value)
+    except OSError:
+        pass
+    return value
+
+
+@contextlib.contextmanager
+def replacing(path):
+    """Open a file to write that replaces path only once it is complete.
+
+    The data goes to a temporary file next to path, which is renamed
+    over it at the end, so a reader, or a mapping of the old file, never
+    sees half a file. On an error the temporary file is removed.
+    """
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, 'wb') as f:
+            yield f
+        os.replace(temporary, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temporary)
+        raise
+
+
+class BackgroundLoader:
+    """Something derived from the current table, loaded or built on a daemon thread.
+
+    load(*args) returns the object, which has the checksum of the table
+    it came from. It is dropped when use_dataset() switches the table.
+    """
+
+    def __init__(self, name, load):
+        self.name = name
+        self.load = load
+        self.value = None
+        self.builder = None
+        self.lock = threading.Lock()
+        add_table_listener(self.drop)
+
+    def start(self, *args):
+        """Run load(*args) on a daemon thread unless the value is ready or on its way"""
+        with self.lock:
+            if self.get() is not None or (self.builder is not None and self.builder.is_alive()):
+                return self.builder
+            self.builder = threading.Thread(target=self._run, args=args, name=self.name, daemon=True)
+            self.builder.start()
+            return self.builder
+
+    def _run(self, *args):
+        self.value = self.load(*args)
+
+    def get(self, wait=False):
+        """The value for the current table, or None while it is being built"""
+        builder = self.builder
+        if wait and builder is not None:
+            builder.join()
+        value = self.value
+        if value is None or value.checksum != get_table().checksum:
+            return None
+        return value
+
+    def drop(self, table=None):
+        self.value = None
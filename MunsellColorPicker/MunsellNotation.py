@@ -0,0 +1,191 @@
+import bisect
+import re
+from .MunsellTable import get_table
+
+# Hue families in table order. Each spans 10 hue steps and four table
+# hues, 2.5 to 10, so table hue 0 is 2.5R and hue 39 is 10RP.
+HUE_FAMILIES = ['R', 'YR', 'Y', 'GY', 'G', 'BG', 'B', 'PB', 'P', 'RP']
+# Munsell value of each value index; the last row is left uncharted.
+VALUE_STEPS = [0, 0.2, 0.4, 0.6, 0.8, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+# Munsell chroma per chroma index.
+CHROMA_STEP = 2
+
+_NUMBER = r'(\d+(?:\.\d*)?|\.\d+)'
+NOTATION = re.compile(r'\s*(?:(N)|' + _NUMBER + r'\s*(' + '|'.join(sorted(HUE_FAMILIES, key=len, reverse=True))
+                      + r'))\s*' + _NUMBER + r'\s*(?:/\s*' + _NUMBER + r'?)?\s*', re.IGNORECASE)
+_FAMILIES = {family: n for n, family in enumerate(HUE_FAMILIES)}
+
+
+def _number(x, digits):
+    text = f"{x:.{digits}f}"
+    if '.' in text:
+        text = text.rstrip('0').rstrip('.')
+    return '0' if text == '-0' else text
+
+def _hue_steps(hue, hues, scale):
+    # Hue steps from 0 at 10RP to 100 just before it, counted in 1 / scale.
+    return round((hue + 1) * 100 / hues % 100 * scale) % (100 * scale)
+
+def _hue_text(steps, digits):
+    scale = 10 ** digits
+    if not steps:
+        return '10RP'
+    family = (steps - 1) // (10 * scale)
+    return _number(steps / scale - family * 10, digits) + HUE_FAMILIES[family]
+
+def hue_name(hue, hues, digits=1):
+    """Munsell hue like '2.5YR' of a fractional table hue index"""
+    return _hue_text(_hue_steps(hue, hues, 10 ** digits), digits)
+
+def value_name(value, digits=1):
+    """Munsell value of a fractional value index, as text"""
+    scale = 10 ** digits
+    return _number(round(munsell_value(value) * scale) / scale, digits)
+
+def munsell_value(value):
+    """Munsell value of a fractional value index, linear between VALUE_STEPS"""
+    last = len(VALUE_STEPS) - 1
+    value = min(max(value, 0), last)
+    j = min(int(value), last - 1)
+    return VALUE_STEPS[j] + (value - j) * (VALUE_STEPS[j + 1] - VALUE_STEPS[j])
+
+def value_index(value):
+    """Fractional value index of a Munsell value from 0 to 10"""
+    if not 0 <= value <= VALUE_STEPS[-1]:
+        raise ValueError(f"value {value} is outside 0 to {VALUE_STEPS[-1]}")
+    j = min(bisect.bisect_right(VALUE_STEPS, value), len(VALUE_STEPS) - 1) - 1
+    return j + (value - VALUE_STEPS[j]) / (VALUE_STEPS[j + 1] - VALUE_STEPS[j])
+
+
+def format_munsell(hue, value, chroma, digits=1):
+    """Munsell notation like '2.5YR 6/8' of table coordinates (hue, value, chroma).
+
+    Numbers are rounded to digits decimals with trailing zeros dropped.
+    A chroma that rounds to 0 gives a neutral like 'N 6/'.
+    """
+    scale = 10 ** digits
+    amount = round(chroma * CHROMA_STEP * scale)
+    if amount <= 0:
+        return f"N {value_name(value, digits)}/"
+    return f"{hue_name(hue, get_table().hues, digits)} {value_name(value, digits)}/{_number(amount / scale, digits)}"
+
+def parse_munsell(text):
+    """Table coordinates (hue, value, chroma) of Munsell notation such as '2.5YR 6/8' or 'N 5/'.
+
+    Families are case-insensitive and spaces are optional, so '2.5yr6/8'
+    and 'N5' parse too. '0YR' is read as '10R'. Neutrals get hue 0 and
+    chroma 0; any other hue needs a chroma. Raises ValueError on anything
+    else.
+    """
+    return _parse(text, get_table().hues)
+
+def _parse(text, hues):
+    match = NOTATION.fullmatch(text)
+    if match is None:
+        raise ValueError(f"bad Munsell notation {text!r}")
+    neutral, number, family, value, chroma = match.groups()
+    value = value_index(float(value))
+    if neutral:
+        if chroma and float(chroma):
+            raise ValueError(f"neutral {text!r} has a chroma")
+        return 0.0, value, 0.0
+    if chroma is None:
+        raise ValueError(f"hue {number}{family} has no chroma in {text!r}")
+    number = float(number)
+    if number > 10:
+        raise ValueError(f"hue number {number} is above 10 in {text!r}")
+    return _hue_index(number, family, hues), value, float(chroma) / CHROMA_STEP
+
+def _hue_index(number, family, hues):
+    return ((_FAMILIES[family.upper()] * 10 + number) * hues / 100 - 1) % hues
+
+
+class NotationTables:
+    """Precomputed text for format_munsell_batch and parse_munsell_batch.
+
+    Hue names are tabled per 1 / 10**digits of a hue step and value names
+    per 1 / 10**digits of a value, so formatting a color is three list
+    lookups. Chromas are tabled up to the table's highest. The same names
+    map back to coordinates, so parsing text written by format is three
+    dict lookups too.
+    """
+
+    def __init__(self, hues, chromas, digits):
+        self.hues = hues
+        self.digits = digits
+        self.scale = 10 ** digits
+        steps = 100 * self.scale
+        self.hue_names = [_hue_text(n, digits) for n in range(steps)]
+        self.value_names = [_number(n / self.scale, digits) for n in range(VALUE_STEPS[-1] * self.scale + 1)]
+        self.chroma_names = [_number(n / self.scale, digits)
+                             for n in range(CHROMA_STEP * chromas * self.scale + 1)]
+        # Coordinates worked out from the names the way _parse does, so
+        # both parsers give the same floats.
+        self.hue_coords = {}
+        for n, name in enumerate(self.hue_names):
+            family = HUE_FAMILIES[(n - 1) // (10 * self.scale)] if n else HUE_FAMILIES[-1]
+            self.hue_coords[name] = _hue_index(float(name[:-len(family)]), family, hues)
+        self.value_coords = {name: value_index(float(name)) for name in self.value_names}
+        self.chroma_coords = {name: float(name) / CHROMA_STEP for name in self.chroma_names}
+
+    def format(self, hue, value, chroma):
+        scale = self.scale
+        amount = round(chroma * CHROMA_STEP * scale)
+        value = self.value_names[round(munsell_value(value) * scale)]
+        if amount <= 0:
+            return f"N {value}/"
+        steps = _hue_steps(hue, self.hues, scale)
+        if amount < len(self.chroma_names):
+            chroma = self.chroma_names[amount]
+        else:
+            chroma = _number(amount / scale, self.digits)
+        return f"{self.hue_names[steps]} {value}/{chroma}"
+
+    def parse(self, text):
+        """Coordinates of text written the way format writes it, else None"""
+        hue, _, rest = text.partition(' ')
+        value, slash, chroma = rest.partition('/')
+        value = self.value_coords.get(value)
+        if value is None or not slash:
+            return None
+        if hue == 'N':
+            return None if chroma else (0.0, value, 0.0)
+        hue = self.hue_coords.get(hue)
+        chroma = self.chroma_coords.get(chroma)
+        if hue is None or chroma is None:
+            return None
+        return hue, value, chroma
+
+
+_tables = {}
+
+def notation_tables(digits=1):
+    """NotationTables for the current table's shape, built on first use"""
+    table = get_table()
+    key = (table.hues, table.chromas, digits)
+    tables = _tables.get(key)
+    if tables is None:
+        tables = _tables[key] = NotationTables(*key)
+    return tables
+
+def format_munsell_batch(coords, digits=1):
+    """format_munsell over a sequence of (hue, value, chroma), or an (n, 3) array"""
+    if hasattr(coords, 'tolist'):
+        coords = coords.tolist()
+    format_one = notation_tables(digits).format
+    return [format_one(*c) for c in coords]
+
+def parse_munsell_batch(texts, digits=1):
+    """parse_munsell over a sequence of strings.
+
+    Text as format_munsell writes it with up to digits decimals is looked
+    up in the notation tables; anything else goes through parse_munsell.
+    """
+    tables = notation_tables(digits)
+    parse_one = tables.parse
+    hues = tables.hues
+    out = []
+    for text in texts:
+        coords = parse_one(text)
+        out.append(_parse(text, hues) if coords is None else coords)
+    return out
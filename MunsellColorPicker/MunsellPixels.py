@@ -0,0 +1,72 @@
+import sys
+from .MunsellInterpolate import munsell_entry_exists, munsell_interpolate, munsell_interpolate_batch
+
+# Bytes per pixel of each packed layout. rgb888 is R, G, B, as in
+# QImage.Format_RGB888. argb32 is a native-endian 0xAARRGGBB word, as in
+# QImage.Format_ARGB32, which is B, G, R, A in memory on little-endian
+# machines, the byte order of Krita's 8-bit RGBA pixel data.
+PIXEL_LAYOUTS = {'rgb888': 3, 'argb32': 4}
+
+# Byte positions of red, green, blue and alpha within an argb32 pixel.
+if sys.byteorder == 'little':
+    ARGB32_ORDER = (2, 1, 0, 3)
+else:
+    ARGB32_ORDER = (1, 2, 3, 0)
+
+
+def pixel_buffer(count, layout='rgb888'):
+    """A zeroed bytearray for count pixels"""
+    return bytearray(count * PIXEL_LAYOUTS[layout])
+
+def munsell_interpolate_into(buffer, points, layout='rgb888', offset=0, interpolate=munsell_interpolate):
+    """Write the color of each (hue, value, chroma) in points into buffer.
+
+    buffer is anything writable with the buffer protocol, such as a
+    bytearray, a memoryview or the bits of a QImage, and pixels are
+    packed from byte offset onwards in the given layout. In argb32,
+    alpha is 255 where munsell_entry_exists and 0 elsewhere, so uncharted
+    points come out transparent. Returns the number of pixels written.
+    """
+    view = memoryview(buffer).cast('B')
+    size = PIXEL_LAYOUTS[layout]
+    pr, pg, pb, pa = ARGB32_ORDER
+    o = offset
+    count = 0
+    for i, j, k in points:
+        if o + size > len(view):
+            raise ValueError("buffer is too small for the points")
+        r, g, b = interpolate(i, j, k)
+        if size == 3:
+            view[o] = r; view[o + 1] = g; view[o + 2] = b
+        else:
+            view[o + pr] = r; view[o + pg] = g; view[o + pb] = b
+            view[o + pa] = 255 if munsell_entry_exists(i, j, k) else 0
+        o += size
+        count += 1
+    return count
+
+def munsell_interpolate_batch_into(buffer, hues, values, chromas, layout='rgb888', offset=0):
+    """munsell_interpolate_batch written straight into buffer, see munsell_interpolate_into.
+
+    The coordinates broadcast like munsell_interpolate_batch and pixels
+    are written in C order of the broadcast shape, so a (rows, columns)
+    grid fills an image row by row. Returns the number of pixels written.
+    """
+    import numpy as np
+    rgb, valid = munsell_interpolate_batch(hues, values, chromas)
+    count = valid.size
+    size = PIXEL_LAYOUTS[layout]
+    out = np.frombuffer(buffer, dtype=np.uint8)
+    if offset + count * size > out.size:
+        raise ValueError("buffer is too small for the points")
+    out = out[offset:offset + count * size].reshape(count, size)
+    if size == 3:
+        out[:] = rgb.reshape(count, 3)
+    else:
+        pr, pg, pb, pa = ARGB32_ORDER
+        rgb = rgb.reshape(count, 3)
+        out[:, pr] = rgb[:, 0]
+        out[:, pg] = rgb[:, 1]
+        out[:, pb] = rgb[:, 2]
+        out[:, pa] = np.where(valid.ravel(), 255, 0)
+    return count
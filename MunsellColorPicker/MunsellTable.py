@@ -0,0 +1,330 @@
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+NaN = float('nan')
+
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'MunsellTable.bin')
+
+# 32 byte header: magic, format version, array typecode, hues, values,
+# chromas, channels, the byte offset of the little-endian data and the
+# content checksum. The typecode is 'd' for float64 values or 'H' for
+# the uint16 fixed point values made by quantize_table(). The header is
+# followed by one run length byte per (hue, value) row, then the data,
+# which holds the charted chromas 0 .. run - 1 of every row in order.
+TABLE_MAGIC = b'MNSL'
+TABLE_VERSION = 3
+TABLE_HEADER = struct.Struct('<4sHcxHHHHI8s4x')
+TABLE_TYPECODES = ('d', 'H')
+
+# uint16 fixed point: stored = round((value + QUANT_OFFSET) * QUANT_SCALE).
+# That covers [-32, 32) in steps of 1/1024, a quarter of an 8-bit step.
+# The handful of wild out-of-gamut values beyond are clamped, which is
+# still far enough out to saturate any blend they take part in.
+QUANT_BITS = 10
+QUANT_SCALE = 1 << QUANT_BITS
+QUANT_OFFSET = 32
+
+
+class TableView:
+    """Read-only nested view over a MunsellTable.
+
+    Indexing works like the old nested list: view[hue][value][chroma]
+    gives a [r, g, b] list, NaN for uncharted cells, negative indices
+    wrap and out of range indices raise IndexError.
+    """
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index=()):
+        self.table = table
+        self.index = index
+
+    def __len__(self):
+        return self.table.shape[len(self.index)]
+
+    def __getitem__(self, i):
+        size = len(self)
+        if i < 0:
+            i += size
+        if not 0 <= i < size:
+            raise IndexError('Munsell table index out of range')
+        index = self.index + (i,)
+        if len(index) == 3:
+            return self.table.cell(*index)
+        return TableView(self.table, index)
+
+
+class MunsellTable:
+    """Renotation data stored sparsely, one run of charted chromas per row.
+
+    Row r = hue * values + value holds chromas 0 .. runs[r] - 1, and the
+    channels of chroma k in that row start at data[(starts[r] + k) * channels].
+    data is an array('d') or array('H') or, for a memory-mapped file, a
+    read-only memoryview over the mapping, which is kept alive in
+    self.mapping.
+    """
+
+    def __init__(self, data, runs, hues, values, chromas, channels=3, mapping=None, checksum=None):
+        self.data = data
+        self.typecode = data.typecode if isinstance(data, array) else data.format
+        self.runs = runs
+        self.hues = hues
+        self.values = values
+        self.chromas = chromas
+        self.channels = channels
+        self.shape = (hues, values, chromas, channels)
+        self.mapping = mapping
+        self.starts = array('l', [0]) * len(runs)
+        start = 0
+        for row, run in enumerate(runs):
+            self.starts[row] = start
+            start += run
+        self.size = start
+        self.charted = charted_bits(runs, chromas)
+        # Hex digest of the content, whatever format it was loaded from.
+        # Caches derived from the table compare it to detect new data.
+        self.checksum = checksum or table_checksum(self)
+
+    def __len__(self):
+        return self.hues
+
+    def __getitem__(self, hue):
+        return TableView(self)[hue]
+
+    def cell(self, hue, value, chroma):
+        row = hue * self.values + value
+        if chroma >= self.runs[row]:
+            return [NaN] * self.channels
+        offset = (self.starts[row] + chroma) * self.channels
+        return list(self.data[offset:offset + self.channels])
+
+    def chips(self):
+        """(hue, value, chroma, channels) for every charted cell, skipping the rest"""
+        data = self.data
+        channels = self.channels
+        offset = 0
+        for row, run in enumerate(self.runs):
+            hue, value = divmod(row, self.values)
+            for chroma in range(run):
+                yield hue, value, chroma, list(data[offset:offset + channels])
+                offset += channels
+
+    def cell_index(self, hue, value, chroma):
+        """Cell number of table[hue][value][chroma], wrapping and raising IndexError the same way"""
+        if not (-self.hues <= hue < self.hues and -self.values <= value < self.values
+                and -self.chromas <= chroma < self.chromas):
+            raise IndexError('Munsell table index out of range')
+        return ((hue % self.hues) * self.values + value % self.values) * self.chromas + chroma % self.chromas
+
+    def is_charted(self, cell):
+        return self.charted[cell >> 3] >> (cell & 7) & 1 == 1
+
+
+def charted_bits(runs, chromas):
+    """Bitset with bit n set when cell n holds data"""
+    bits = bytearray((len(runs) * chromas + 7) // 8)
+    for row, run in enumerate(runs):
+        for cell in range(row * chromas, row * chromas + run):
+            bits[cell >> 3] |= 1 << (cell & 7)
+    return bits
+
+
+def table_checksum(table):
+    """First 64 bits of the SHA-256 of the dimensions, runs and little-endian values"""
+    # Only tables built in memory need this, so loading a file skips
+    # importing hashlib.
+    import hashlib
+    data = array(table.typecode, table.data)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    digest = hashlib.sha256(struct.pack('<4H', table.hues, table.values, table.chromas, table.channels))
+    digest.update(bytes(table.runs))
+    digest.update(data.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def table_from_nested(nested):
+    """Pack a nested Munsell[h][v][c] list into a MunsellTable"""
+    hues = len(nested)
+    values = len(nested[0])
+    chromas = len(nested[0][0])
+    channels = len(nested[0][0][0])
+    runs = bytearray()
+    data = array('d')
+    for hue in nested:
+        for row in hue:
+            charted = [not any(math.isnan(x) for x in triple) for triple in row]
+            run = charted.index(False) if False in charted else chromas
+            if any(charted[run:]):
+                raise ValueError("charted chromas must start at 0 and be contiguous in every row")
+            runs.append(run)
+            for triple in row[:run]:
+                data.extend(triple)
+    return MunsellTable(data, bytes(runs), hues, values, chromas, channels)
+
+
+def quantize_table(table):
+    """uint16 fixed point copy of a float table, see QUANT_SCALE"""
+    data = array('H', (min(0xFFFF, max(0, round((x + QUANT_OFFSET) * QUANT_SCALE))) for x in table.data))
+    return MunsellTable(data, table.runs, table.hues, table.values, table.chromas, table.channels)
+
+
+def data_offset(runs):
+    # The data starts on an 8 byte boundary so it can be mapped.
+    return (TABLE_HEADER.size + len(runs) + 7) // 8 * 8
+
+
+def write_table(path, table):
+    data = array(table.typecode, table.data)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    offset = data_offset(table.runs)
+    header = TABLE_HEADER.pack(TABLE_MAGIC, TABLE_VERSION, table.typecode.encode(),
+                               table.hues, table.values, table.chromas, table.channels,
+                               offset, bytes.fromhex(table.checksum))
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(table.runs)
+        f.write(bytes(offset - TABLE_HEADER.size - len(table.runs)))
+        data.tofile(f)
+
+
+def read_header(path, blob):
+    magic, version, typecode, hues, values, chromas, channels, offset, checksum = TABLE_HEADER.unpack_from(blob)
+    typecode = typecode.decode('ascii', 'replace')
+    if magic != TABLE_MAGIC or version != TABLE_VERSION or typecode not in TABLE_TYPECODES:
+        raise ValueError(f"{path} is not a Munsell table file")
+    runs = bytes(blob[TABLE_HEADER.size:TABLE_HEADER.size + hues * values])
+    return typecode, hues, values, chromas, channels, offset, runs, checksum.hex()
+
+
+def read_table(path=TABLE_FILE):
+    """Read the table file into a private in-memory array"""
+    with open(path, 'rb') as f:
+        blob = f.read()
+    typecode, hues, values, chromas, channels, offset, runs, checksum = read_header(path, blob)
+    data = array(typecode)
+    data.frombytes(blob[offset:offset + sum(runs) * channels * data.itemsize])
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return MunsellTable(data, runs, hues, values, chromas, channels, checksum=checksum)
+
+
+def map_table(path=TABLE_FILE):
+    """Memory-map the table file read-only and index it without copying.
+
+    Every process that maps the same file shares its page cache pages.
+    The file stores little-endian values, so big-endian hosts get a
+    private byte-swapped copy instead.
+    """
+    if sys.byteorder != 'little':
+        return read_table(path)
+    with open(path, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    typecode, hues, values, chromas, channels, offset, runs, checksum = read_header(path, mapping)
+    size = sum(runs) * channels * array(typecode).itemsize
+    data = memoryview(mapping)[offset:offset + size].cast(typecode)
+    return MunsellTable(data, runs, hues, values, chromas, channels, mapping, checksum)
+
+
+def load_table(path=TABLE_FILE, mapped=True):
+    """Load the packed table, building it from the literal if the file is missing"""
+    try:
+        return map_table(path) if mapped else read_table(path)
+    except FileNotFoundError:
+        from .MunsellFloats import Munsell as nested
+        return table_from_nested(nested)
+
+
+def table_from_source(source):
+    """Normalize a dataset into a MunsellTable.
+
+    source is a MunsellTable, a nested Munsell[h][v][c] list, the path
+    of a table file, or a callable returning one of those. The engine
+    reads float values, so uint16 tables are refused with ValueError;
+    those only go to munsell_interpolate_fixed(table=...).
+    """
+    if callable(source):
+        source = source()
+    if isinstance(source, (str, os.PathLike)):
+        source = map_table(source)
+    if not isinstance(source, MunsellTable):
+        return table_from_nested(source)
+    if source.typecode != 'd':
+        raise ValueError(f"a {source.typecode!r} table is not a dataset, use it with munsell_interpolate_fixed")
+    return source
+
+
+# Built-in data is the renotation chips that were actually measured.
+DEFAULT_DATASET = 'renotation'
+
+_datasets = {DEFAULT_DATASET: load_table}
+_dataset = DEFAULT_DATASET
+_table = None
+_listeners = []
+
+
+def register_dataset(name, source):
+    """Make a dataset available to use_dataset(), see table_from_source() for source"""
+    _datasets[name] = source
+
+
+def dataset_names():
+    return list(_datasets)
+
+
+def current_dataset():
+    return _dataset
+
+
+def use_dataset(name):
+    """Switch every engine function to another registered dataset.
+
+    The dataset is loaded right away, so a bad one fails here and leaves
+    the current table in place. Table listeners are told afterwards so
+    they can drop anything derived from the old table. Every listener is
+    called even if one raises; the first error is raised once all of them
+    have run, with the new table already in place.
+    """
+    global _dataset, _table
+    table = table_from_source(_datasets[name])
+    _dataset = name
+    _table = table
+    error = None
+    for callback in list(_listeners):
+        try:
+            callback(table)
+        except Exception as e:
+            if error is None:
+                error = e
+    if error is not None:
+        raise error
+
+
+def add_table_listener(callback):
+    """Call callback(table) whenever use_dataset() switches the table"""
+    _listeners.append(callback)
+
+
+def remove_table_listener(callback):
+    if callback in _listeners:
+        _listeners.remove(callback)
+
+
+def get_table():
+    """The current dataset's table, loaded on first use"""
+    global _table
+    if _table is None:
+        _table = table_from_source(_datasets[_dataset])
+    return _table
+
+
+def __getattr__(name):
+    # Keeps "from .MunsellTable import Munsell" working without loading
+    # the data when the module is imported.
+    if name == 'Munsell':
+        return get_table()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -24,3 +24,7 @@ def lightness_map(j):
         return j * 0.02
     else:
         return (j - 4) / 10.0
+
+def color_displayable(rgb):
+    """Swatches this dark read as black in the grids, so the grids stop there"""
+    return sum(rgb) > 30
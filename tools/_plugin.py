@@ -0,0 +1,19 @@
+"""Import the plugin's engine modules outside Krita.
+
+The package __init__ registers the docker with Krita and can only run
+inside it. The tools only need the engine modules, so the package path is
+registered here without executing __init__.
+"""
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN_DIR = os.path.join(ROOT, 'MunsellColorPicker')
+
+
+def load():
+    if 'MunsellColorPicker' not in sys.modules:
+        package = types.ModuleType('MunsellColorPicker')
+        package.__path__ = [PLUGIN_DIR]
+        sys.modules['MunsellColorPicker'] = package
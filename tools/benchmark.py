@@ -0,0 +1,848 @@
+"""Benchmarks for the Munsell table and interpolation engine.
+
+Usage: python tools/benchmark.py [section ...]
+
+Run without arguments to run every section.
+"""
+import json
+import math
+import os
+import re
+import subprocess
+import sys
+import time
+
+import _plugin
+
+_plugin.load()
+
+# Loads a table in a fresh interpreter and reports how long the load
+# took and the peak RSS it added. With trace set, reports the Python heap
+# the load left behind instead; tracemalloc slows the load down, so the
+# two are measured separately.
+IMPORT_PROBE = '''
+import json, resource, sys, time, tracemalloc
+sys.path.insert(0, {tools!r})
+import _plugin
+_plugin.load()
+if {trace}:
+    tracemalloc.start()
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+heap = tracemalloc.get_traced_memory()[0] if {trace} else 0
+print(json.dumps([elapsed, after - before, heap]))
+'''
+
+
+def run_probe(code):
+    """Run code in a fresh interpreter and return what it printed as JSON.
+
+    Bytecode writing is forced on, so after a first run the probes time
+    loading cached .pyc files, as Krita does, not compiling the modules.
+    """
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, env=env)
+    return json.loads(out.stdout)
+
+
+def probe_import(statement, trace=False):
+    return run_probe(IMPORT_PROBE.format(tools=_plugin.ROOT + '/tools', statement=statement, trace=trace))
+
+
+def bench_import(runs=5):
+    print(f"import (best of {runs}, warm .pyc)")
+    for label, statement in [('literal', 'import MunsellColorPicker.MunsellFloats'),
+                             ('packed', 'import MunsellColorPicker.MunsellTable as t; t.get_table()')]:
+        # The first run may compile the .pyc, so it is left out.
+        probe_import(statement)
+        samples = [probe_import(statement) for _ in range(runs)]
+        heap = probe_import(statement, trace=True)[2]
+        elapsed = min(s[0] for s in samples)
+        rss = min(s[1] for s in samples)
+        print(f"  {label:8} {elapsed * 1000:8.1f} ms  rss +{rss:6d} KiB  heap {heap / 1024:6.0f} KiB")
+
+
+# Loads the table in a fresh interpreter, touches every value and reports
+# how much private dirty memory that added. Pages of a mapped file stay
+# clean and can be shared with every other process mapping it. Linux only.
+LOAD_PROBE = '''
+import json, sys
+sys.path.insert(0, {tools!r})
+import _plugin
+_plugin.load()
+
+def dirty_kib():
+    with open('/proc/self/smaps_rollup') as f:
+        fields = dict(line.split(':', 1) for line in f if ':' in line)
+    return int(fields['Private_Dirty'].split()[0])
+
+from MunsellColorPicker import MunsellTable
+before = dirty_kib()
+table = MunsellTable.load_table(mapped={mapped})
+total = sum(x for x in table.data if x == x)
+print(json.dumps(dirty_kib() - before))
+'''
+
+
+def bench_mmap(runs=5):
+    print(f"load and touch the whole table (best of {runs})")
+    for label, mapped in [('read', False), ('mmap', True)]:
+        code = LOAD_PROBE.format(tools=_plugin.ROOT + '/tools', mapped=mapped)
+        samples = [run_probe(code) for _ in range(runs)]
+        print(f"  {label:8} private dirty +{min(samples):6d} KiB")
+
+
+# Imports the engine modules the docker module imports and reports whether
+# that touched the table data.
+STARTUP_PROBE = '''
+import json, sys, time
+sys.path.insert(0, {tools!r})
+import _plugin
+_plugin.load()
+start = time.perf_counter()
+{imports}
+elapsed = time.perf_counter() - start
+from MunsellColorPicker import MunsellTable
+loaded = MunsellTable._table is not None or 'MunsellColorPicker.MunsellFloats' in sys.modules
+print(json.dumps([elapsed, loaded]))
+'''
+
+STARTUP_BUDGET_MS = 20.0
+
+
+def docker_imports():
+    """import statements for the plugin modules MunsellColorPicker.py imports"""
+    with open(os.path.join(_plugin.PLUGIN_DIR, 'MunsellColorPicker.py')) as f:
+        modules = re.findall(r'^from \.(\w+) import', f.read(), re.MULTILINE)
+    return '\n'.join(f'import MunsellColorPicker.{name}' for name in modules)
+
+
+def bench_startup(runs=5):
+    """Fails when registering the plugin would load the table or blow the budget"""
+    code = STARTUP_PROBE.format(tools=_plugin.ROOT + '/tools', imports=docker_imports())
+    samples = [run_probe(code) for _ in range(runs + 1)][1:]
+    elapsed = min(s[0] for s in samples) * 1000
+    loaded = any(s[1] for s in samples)
+    print(f"plugin import of {docker_imports().count('import')} modules (best of {runs}): {elapsed:.1f} ms, budget {STARTUP_BUDGET_MS:.0f} ms, "
+          f"table loaded: {loaded}")
+    if loaded or elapsed > STARTUP_BUDGET_MS:
+        sys.exit("plugin import is over budget")
+
+
+def nested_interpolate(i, j, k):
+    """The original kernel over the MunsellFloats literal, kept as a baseline"""
+    from MunsellColorPicker.MunsellFloats import Munsell
+    from MunsellColorPicker.Utils import color_charted, mul
+    try:
+        if not color_charted(Munsell[int(i)][int(j)][int(k)]):
+            return [0, 0, 0]
+    except (IndexError, ValueError):
+        return [0, 0, 0]
+    i0 = int(math.floor(i))
+    j0 = int(math.floor(j))
+    k0 = int(math.floor(k))
+    i1 = (i0 + 1) % 40
+    j1 = j0 + 1
+    k1 = k0 + 1
+    a1 = i - i0
+    b1 = j - j0
+    c1 = k - k0
+    a0 = 1 - a1
+    b0 = 1 - b1
+    c0 = 1 - c1
+    ans = [0.0, 0.0, 0.0]
+    for t in range(3):
+        ans[t] = (
+            mul(a0 * b0 * c0, Munsell[i0][j0][k0][t]) +
+            mul(a1 * b0 * c0, Munsell[i1][j0][k0][t]) +
+            mul(a0 * b1 * c0, Munsell[i0][j1][k0][t]) +
+            mul(a1 * b1 * c0, Munsell[i1][j1][k0][t]) +
+            mul(a0 * b0 * c1, Munsell[i0][j0][k1][t]) +
+            mul(a1 * b0 * c1, Munsell[i1][j0][k1][t]) +
+            mul(a0 * b1 * c1, Munsell[i0][j1][k1][t]) +
+            mul(a1 * b1 * c1, Munsell[i1][j1][k1][t])
+        )
+    return [int(max(0, min(255, round(v * 255)))) for v in ans]
+
+
+def grid_sweeps():
+    """Every (hue, value, chroma) the three grid generators can ask for"""
+    # Fixed Hue: hue from the foreground HLS hue, so usually fractional.
+    light_chroma = [(h * 0.25, j, k) for h in range(160) for j in range(1, 15) for k in range(26)]
+    # Fixed Light: integer hue, value and chroma.
+    hue_chroma = [(i, j, k) for j in range(1, 11) for i in range(40) for k in range(26)]
+    # Fixed Chroma: integer hue and value, chroma in [0, 1].
+    light_hue = [(i, j, c / 25) for c in range(26) for j in range(1, 15) for i in range(40)]
+    return {'light-chroma': light_chroma, 'hue-chroma': hue_chroma, 'light-hue': light_hue}
+
+
+def calls_per_second(function, points, min_time=0.5):
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        for p in points:
+            function(*p)
+        calls += len(points)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return calls / elapsed
+
+
+def bench_sweep():
+    from MunsellColorPicker.MunsellInterpolate import munsell_interpolate
+    print("munsell_interpolate over the grid generator sweeps (calls/s)")
+    print(f"  {'sweep':14} {'nested':>10} {'engine':>10}")
+    for name, points in grid_sweeps().items():
+        before = calls_per_second(nested_interpolate, points)
+        after = calls_per_second(munsell_interpolate, points)
+        print(f"  {name:14} {before:10.0f} {after:10.0f}  x{after / before:.2f}")
+
+
+def kernel_cases():
+    """Charted lattice points, and the same points moved off the lattice along some axes"""
+    from MunsellColorPicker.MunsellInterpolate import munsell_entry_exists
+    from MunsellColorPicker.MunsellTable import get_table
+    table = get_table()
+    lattice = [(i, j, k) for i in range(table.hues) for j in range(table.values)
+               for k in range(table.chromas) if munsell_entry_exists(i, j, k)]
+    def offset(di, dj, dk):
+        return [(i + di, j + dj, k + dk) for i, j, k in lattice]
+
+    # Which coordinates are fractional decides how many corners blend.
+    return {
+        'lattice': lattice,
+        'hue': offset(0.3, 0, 0),
+        'value': offset(0, 0.6, 0),
+        'chroma': offset(0, 0, 0.45),
+        'hue-value': offset(0.3, 0.6, 0),
+        'hue-chroma': offset(0.3, 0, 0.45),
+        'value-chroma': offset(0, 0.6, 0.45),
+        'fractional': offset(0.3, 0.6, 0.45),
+    }
+
+
+def bench_kernel():
+    from MunsellColorPicker.MunsellInterpolate import munsell_interpolate
+    print("munsell_interpolate on charted points (ns/call)")
+    print(f"  {'case':14} {'nested':>10} {'engine':>10}")
+    for name, points in kernel_cases().items():
+        before = 1e9 / calls_per_second(nested_interpolate, points)
+        after = 1e9 / calls_per_second(munsell_interpolate, points)
+        print(f"  {name:14} {before:10.0f} {after:10.0f}  x{before / after:.2f}")
+
+
+def nested_entry_exists(hue, value, chroma):
+    """The original existence check over the MunsellFloats literal"""
+    from MunsellColorPicker.MunsellFloats import Munsell
+    from MunsellColorPicker.Utils import color_charted
+    try:
+        return color_charted(Munsell[int(hue)][int(value)][int(chroma)])
+    except (IndexError, ValueError):
+        return False
+
+
+def bench_exists():
+    from MunsellColorPicker.MunsellInterpolate import munsell_entries_exist, munsell_entry_exists
+    from MunsellColorPicker.MunsellTable import load_table
+    points = [(i, j, k) for i in range(40) for j in range(16) for k in range(27)]
+    start = time.perf_counter()
+    load_table()
+    print(f"table load with validity bitset: {(time.perf_counter() - start) * 1000:.1f} ms")
+    print("entry exists over every lattice cell (calls/s)")
+    print(f"  {'nested':14} {calls_per_second(nested_entry_exists, points):10.0f}")
+    print(f"  {'bitset':14} {calls_per_second(munsell_entry_exists, points):10.0f}")
+    columns = list(zip(*points))
+    batch = calls_per_second(munsell_entries_exist, [columns]) * len(points)
+    print(f"  {'batch, tuples':14} {batch:10.0f}")
+    try:
+        import numpy as np
+    except ImportError:
+        return
+    arrays = [np.array(c) for c in columns]
+    batch = calls_per_second(munsell_entries_exist, [arrays]) * len(points)
+    print(f"  {'batch, arrays':14} {batch:10.0f}")
+
+
+def bench_fixed():
+    """Fails unless the fixed point kernel is within one 8-bit step on the half-step grid"""
+    from MunsellColorPicker.MunsellInterpolate import (
+        get_quantized_table, munsell_interpolate, munsell_interpolate_fixed,
+    )
+    from MunsellColorPicker.MunsellTable import get_table
+    table = get_table()
+    points = [(i / 2, j / 2, k / 2) for i in range(2 * table.hues)
+              for j in range(2 * table.values) for k in range(2 * table.chromas)]
+    worst = max(max(abs(a - b) for a, b in zip(munsell_interpolate(*p), munsell_interpolate_fixed(*p)))
+                for p in points)
+    quantized = get_quantized_table()
+    print(f"fixed point vs float over {len(points)} lattice and half-step points: max difference {worst}")
+    print(f"  table data: float {len(table.data) * 8} bytes, uint16 {len(quantized.data) * 2} bytes")
+    sweep = grid_sweeps()['light-chroma']
+    print(f"  light-chroma sweep: float {calls_per_second(munsell_interpolate, sweep):.0f} calls/s, "
+          f"fixed {calls_per_second(munsell_interpolate_fixed, sweep):.0f} calls/s")
+    if worst > 1:
+        sys.exit("fixed point kernel is more than one 8-bit step off")
+
+
+def bench_batch():
+    """Fails if munsell_interpolate_batch ever differs from munsell_interpolate"""
+    import numpy as np
+    from MunsellColorPicker.MunsellInterpolate import munsell_interpolate, munsell_interpolate_batch
+    print("munsell_interpolate_batch over the grid generator sweeps (points/s)")
+    print(f"  {'sweep':14} {'scalar':>10} {'batch':>12}")
+    for name, points in grid_sweeps().items():
+        columns = np.array(points).T
+        rgb, valid = munsell_interpolate_batch(*columns)
+        if rgb.tolist() != [munsell_interpolate(*p) for p in points]:
+            sys.exit(f"batch results differ from munsell_interpolate on {name}")
+        scalar = calls_per_second(munsell_interpolate, points)
+        batch = calls_per_second(munsell_interpolate_batch, [columns]) * len(points)
+        print(f"  {name:14} {scalar:10.0f} {batch:12.0f}  x{batch / scalar:.1f}")
+
+
+def bench_cache():
+    from MunsellColorPicker.MunsellCache import InterpolationCache
+    from MunsellColorPicker.MunsellInterpolate import munsell_interpolate
+    print("grid sweeps through an InterpolationCache, as on repeated regenerations (calls/s)")
+    print(f"  {'sweep':14} {'engine':>10} {'cold':>10} {'warm':>10}")
+    for name, points in grid_sweeps().items():
+        cache = InterpolationCache(maxsize=len(points))
+        start = time.perf_counter()
+        for p in points:
+            cache(*p)
+        cold = len(points) / (time.perf_counter() - start)
+        engine = calls_per_second(munsell_interpolate, points)
+        warm = calls_per_second(cache, points)
+        stats = cache.stats()
+        print(f"  {name:14} {engine:10.0f} {cold:10.0f} {warm:10.0f}  hit rate {stats['hit_rate']:.3f}")
+        cache.close()
+    cache = InterpolationCache(maxsize=1024)
+    for points in grid_sweeps().values():
+        for p in points:
+            cache(*p)
+    print(f"  bounded to 1024 entries: {cache.stats()}")
+    cache.close()
+    bench_conversion_cache()
+
+
+def painter_session(clicks=2000, seed=3):
+    """Foreground colors of a run of Generate clicks.
+
+    Most clicks come back to one of the last dozen colors, the way a
+    painter alternates between a few mixes. The rest pick a new color.
+    """
+    import random
+    rng = random.Random(seed)
+    recent = []
+    colors = []
+    for _ in range(clicks):
+        if recent and rng.random() < 0.8:
+            rgb = rng.choice(recent)
+        else:
+            rgb = tuple(rng.randrange(256) / 255 for _ in range(3))
+            recent = (recent + [rgb])[-12:]
+        colors.append(rgb)
+    return colors
+
+
+def bench_conversion_cache():
+    """Fails if a ConversionCache ever returns other coordinates than its function"""
+    from MunsellColorPicker.MunsellCache import ConversionCache
+    from MunsellColorPicker.MunsellInverse import rgb_to_munsell
+    colors = painter_session()
+    cache = ConversionCache()
+    wrong = sum(cache(rgb) != rgb_to_munsell(rgb) for rgb in colors)
+    stats = cache.stats()
+    cache.close()
+    engine = calls_per_second(rgb_to_munsell, [(rgb,) for rgb in colors])
+    cache = ConversionCache()
+    cached = calls_per_second(cache, [(rgb,) for rgb in colors])
+    cache.close()
+    print(f"foreground conversions over {len(colors)} Generate clicks: rgb_to_munsell {engine:.0f}/s, "
+          f"through a ConversionCache {cached:.0f}/s")
+    print(f"  {stats}  conversions differing from rgb_to_munsell: {wrong}")
+    if wrong:
+        sys.exit("ConversionCache returns other coordinates than rgb_to_munsell")
+
+
+def bench_lattice():
+    """Fails unless the lattice reproduces munsell_interpolate on every sample and is cached after a build"""
+    import tempfile
+    from MunsellColorPicker.MunsellInterpolate import munsell_interpolate
+    from MunsellColorPicker.MunsellLattice import (
+        get_lattice, munsell_interpolate_nearest, read_lattice, start_lattice_build,
+    )
+    from MunsellColorPicker.MunsellLoader import cached_file
+    with tempfile.TemporaryDirectory() as directory:
+        # An empty directory for the shipped file too, so this always builds.
+        path = os.path.join(directory, 'MunsellLattice.bin')
+        start = time.perf_counter()
+        start_lattice_build(path, directory)
+        returned = time.perf_counter() - start
+        lattice = get_lattice(wait=True)
+        built = time.perf_counter() - start
+        cached = cached_file(path, lattice.checksum, directory)
+        saved = not os.path.exists(path) and read_lattice(cached).data == lattice.data
+    print(f"dense lattice {lattice.hues} x {lattice.values} x {lattice.chromas}, {len(lattice.data)} bytes: "
+          f"start_lattice_build returned in {returned * 1000:.2f} ms, built in {built * 1000:.0f} ms, "
+          f"{'cached' if saved else 'NOT cached'}")
+    sh, sv, sc = lattice.steps
+    samples = [(h / sh, v / sv, c / sc) for h in range(lattice.hues)
+               for v in range(lattice.values) for c in range(lattice.chromas)]
+    wrong = sum(lattice.nearest(*p) != munsell_interpolate(*p) for p in samples)
+    print(f"  samples differing from munsell_interpolate: {wrong}")
+    print(f"  {'sweep':14} {'trilinear':>10} {'nearest':>10} {'max diff':>9}")
+    for name, points in grid_sweeps().items():
+        diff = max(max(abs(a - b) for a, b in zip(munsell_interpolate(*p), munsell_interpolate_nearest(*p)))
+                   for p in points)
+        trilinear = calls_per_second(munsell_interpolate, points)
+        nearest = calls_per_second(lattice.nearest, points)
+        print(f"  {name:14} {trilinear:10.0f} {nearest:10.0f} {diff:9d}")
+    if wrong:
+        sys.exit("lattice samples differ from munsell_interpolate")
+    if not saved:
+        sys.exit("the built lattice was not written to its cache file")
+
+
+def gamut_points(count=100000, seed=1):
+    """Random points with a charted floor cell, spread over the whole table"""
+    import random
+    from MunsellColorPicker.MunsellInterpolate import munsell_entry_exists
+    from MunsellColorPicker.MunsellTable import get_table
+    table = get_table()
+    rng = random.Random(seed)
+    points = []
+    while len(points) < count:
+        p = (rng.uniform(0, table.hues), rng.uniform(0, table.values), rng.uniform(0, table.chromas))
+        if munsell_entry_exists(*p):
+            points.append(p)
+    return points
+
+
+def bench_tetrahedral():
+    """Fails if the batch tetrahedral kernel ever differs from the scalar one"""
+    import numpy as np
+    from MunsellColorPicker.MunsellInterpolate import (
+        munsell_interpolate, munsell_interpolate_batch, munsell_interpolate_tetrahedral,
+        munsell_interpolate_tetrahedral_batch,
+    )
+    points = gamut_points()
+    columns = np.array(points).T
+    trilinear, _ = munsell_interpolate_batch(*columns)
+    tetrahedral, _ = munsell_interpolate_tetrahedral_batch(*columns)
+    if tetrahedral.tolist() != [munsell_interpolate_tetrahedral(*p) for p in points]:
+        sys.exit("batch tetrahedral results differ from munsell_interpolate_tetrahedral")
+    diff = np.abs(tetrahedral.astype(int) - trilinear.astype(int)).max(axis=1)
+    print(f"tetrahedral vs trilinear over {len(points)} random charted points (8-bit levels)")
+    print(f"  identical {np.mean(diff == 0):.3f}  within 1 {np.mean(diff <= 1):.3f}  "
+          f"within 4 {np.mean(diff <= 4):.3f}  mean {diff.mean():.2f}  99th percentile {np.percentile(diff, 99):.0f}  "
+          f"max {diff.max()}")
+    print("throughput over the same points")
+    print(f"  {'kernel':12} {'scalar calls/s':>15} {'batch points/s':>15}")
+    for name, scalar, batch in [('trilinear', munsell_interpolate, munsell_interpolate_batch),
+                                ('tetrahedral', munsell_interpolate_tetrahedral,
+                                 munsell_interpolate_tetrahedral_batch)]:
+        rate = calls_per_second(scalar, points[:20000])
+        batch_rate = calls_per_second(batch, [columns]) * len(points)
+        print(f"  {name:12} {rate:15.0f} {batch_rate:15.0f}")
+
+
+def light_chroma_probed(hue):
+    """Fixed Hue grid rows as generated before the coverage mode: bounded, then probed"""
+    from MunsellColorPicker.MunsellInterpolate import chroma_limit, munsell_interpolate
+    from MunsellColorPicker.MunsellTable import get_table
+    rows = []
+    for j in range(1, get_table().values - 1):
+        row = []
+        for k in range(chroma_limit(hue, j)):
+            color = munsell_interpolate(hue, j, k)
+            if color == [0, 0, 0] or sum(color) <= 30:
+                break
+            row.append(color)
+        rows.append(row)
+    return rows
+
+
+def light_chroma_coverage(hue):
+    """Fixed Hue grid rows from munsell_interpolate_coverage in one pass"""
+    from MunsellColorPicker.MunsellInterpolate import MIN_COVERAGE, munsell_interpolate_coverage
+    from MunsellColorPicker.MunsellTable import get_table
+    from MunsellColorPicker.Utils import color_displayable
+    table = get_table()
+    rows = []
+    for j in range(1, table.values - 1):
+        row = []
+        for k in range(table.chromas):
+            color, coverage = munsell_interpolate_coverage(hue, j, k)
+            if coverage < MIN_COVERAGE or not color_displayable(color):
+                break
+            row.append(color)
+        rows.append(row)
+    return rows
+
+
+def bench_coverage():
+    from MunsellColorPicker.MunsellInterpolate import munsell_interpolate_coverage
+    hues = [h / 4 for h in range(160)]
+    print("Fixed Hue grids for every quarter hue")
+    print(f"  {'generator':10} {'swatches':>9} {'darkened':>9} {'grids/s':>8}")
+    for name, generate in [('probed', light_chroma_probed), ('coverage', light_chroma_coverage)]:
+        swatches = darkened = 0
+        for hue in hues:
+            for j, row in enumerate(generate(hue), 1):
+                for k, color in enumerate(row):
+                    swatches += 1
+                    # Swatches blended with uncharted corners come out too dark.
+                    darkened += color != munsell_interpolate_coverage(hue, j, k)[0]
+        rate = calls_per_second(generate, [(hue,) for hue in hues])
+        print(f"  {name:10} {swatches:9d} {darkened:9d} {rate:8.0f}")
+
+
+def bench_pixels():
+    """Fails unless scalar and batch pixel writers produce the same bytes"""
+    import numpy as np
+    from MunsellColorPicker.MunsellInterpolate import munsell_interpolate
+    from MunsellColorPicker.MunsellPixels import (
+        munsell_interpolate_batch_into, munsell_interpolate_into, pixel_buffer,
+    )
+    points = grid_sweeps()['light-chroma']
+    columns = np.array(points).T
+    print(f"packing {len(points)} light-chroma swatches (swatches/s)")
+
+    def hex_codes():
+        return [f"#{r:02X}{g:02X}{b:02X}" for r, g, b in (munsell_interpolate(*p) for p in points)]
+
+    print(f"  {'hex strings':22} {calls_per_second(hex_codes, [()]) * len(points):10.0f}")
+    for layout in ('rgb888', 'argb32'):
+        scalar = pixel_buffer(len(points), layout)
+        batch = pixel_buffer(len(points), layout)
+        munsell_interpolate_into(scalar, points, layout)
+        munsell_interpolate_batch_into(batch, *columns, layout=layout)
+        if scalar != batch:
+            sys.exit(f"{layout} pixels differ between the scalar and batch writers")
+        rate = calls_per_second(munsell_interpolate_into, [(scalar, points, layout)]) * len(points)
+        batch_rate = calls_per_second(munsell_interpolate_batch_into, [(batch, *columns, layout)]) * len(points)
+        print(f"  {layout + ' scalar':22} {rate:10.0f}")
+        print(f"  {layout + ' batch':22} {batch_rate:10.0f}")
+
+
+def swatch_chain(i, j, k):
+    """A grid cell the way the generators used to check it: ints, floats, then ints twice more"""
+    from MunsellColorPicker.MunsellInterpolate import munsell_interpolate
+    from MunsellColorPicker.Utils import color_charted, color_valid, srgb_coords
+    color = munsell_interpolate(i, j, k)
+    if not color_charted(color):
+        return None
+    color_norm = [c / 255.0 for c in color]
+    if not color_valid(color_norm):
+        return None
+    return color_norm, sum(srgb_coords(color_norm))
+
+
+def bench_swatch():
+    """Fails unless munsell_swatch gives the same swatches as the old checks"""
+    from MunsellColorPicker.MunsellInterpolate import munsell_swatch
+    print("grid cells through the old checks and through munsell_swatch (cells/s)")
+    print(f"  {'sweep':14} {'chain':>10} {'fused':>10}")
+    for name, points in grid_sweeps().items():
+        if any(munsell_swatch(*p) != swatch_chain(*p) for p in points):
+            sys.exit(f"munsell_swatch differs from the old checks on {name}")
+        chain = calls_per_second(swatch_chain, points)
+        fused = calls_per_second(munsell_swatch, points)
+        print(f"  {name:14} {chain:10.0f} {fused:10.0f}  x{fused / chain:.2f}")
+
+
+def finite_difference_jacobian(i, j, k, step=1e-6):
+    """Central differences of munsell_interpolate_float, six probes per point"""
+    from MunsellColorPicker.MunsellInterpolate import munsell_interpolate_float
+    point = (i, j, k)
+    jacobian = [[0.0] * 3 for _ in range(3)]
+    for axis in range(3):
+        ahead = list(point)
+        behind = list(point)
+        ahead[axis] += step
+        behind[axis] -= step
+        up = munsell_interpolate_float(*ahead)[0]
+        down = munsell_interpolate_float(*behind)[0]
+        for channel in range(3):
+            jacobian[channel][axis] = (up[channel] - down[channel]) / (2 * step)
+    return jacobian
+
+
+def bench_jacobian():
+    """Fails if the analytic Jacobian disagrees with finite differences inside cells"""
+    import numpy as np
+    from MunsellColorPicker.MunsellInterpolate import (
+        munsell_interpolate_jacobian, munsell_interpolate_jacobian_batch,
+    )
+    # Keep the probes inside one cell, where the blend is smooth.
+    points = [p for p in gamut_points(20000) if all(1e-4 < x - math.floor(x) < 1 - 1e-4 for x in p)]
+    worst = 0.0
+    for p in points:
+        analytic = munsell_interpolate_jacobian(*p)[1]
+        numeric = finite_difference_jacobian(*p)
+        worst = max(worst, max(abs(a - n) / max(1.0, abs(n)) for ra, rn in zip(analytic, numeric)
+                               for a, n in zip(ra, rn)))
+    columns = np.array(points).T
+    print(f"Jacobian over {len(points)} random points inside charted cells")
+    print(f"  worst relative difference from central differences: {worst:.1e}")
+    print(f"  analytic          {calls_per_second(munsell_interpolate_jacobian, points):10.0f} points/s")
+    print(f"  finite difference {calls_per_second(finite_difference_jacobian, points):10.0f} points/s")
+    batch = calls_per_second(munsell_interpolate_jacobian_batch, [columns]) * len(points)
+    print(f"  analytic batch    {batch:10.0f} points/s")
+    if worst > 1e-6:
+        sys.exit("analytic Jacobian disagrees with finite differences")
+
+
+def random_colors(count=5000, seed=2):
+    import random
+    rng = random.Random(seed)
+    return [(rng.random(), rng.random(), rng.random()) for _ in range(count)]
+
+
+def delta_e(rgb, other):
+    from MunsellColorPicker.MunsellInverse import srgb_to_lab
+    return math.dist(srgb_to_lab(rgb), srgb_to_lab(other))
+
+
+def bench_inverse():
+    """Fails unless every indexed chip inverts to its own coordinates"""
+    import numpy as np
+    from MunsellColorPicker.MunsellInterpolate import munsell_interpolate_float
+    from MunsellColorPicker.MunsellInverse import (
+        NEIGHBOURS, ChipGrid, ChipIndex, _lab_batch, _nearest_brute, chip_index, rgb_to_munsell,
+        rgb_to_munsell_batch,
+    )
+    from MunsellColorPicker.MunsellTable import get_table
+    table = get_table()
+    start = time.perf_counter()
+    ChipIndex(table)
+    print(f"chip index: {len(chip_index().labs)} chips, built in {(time.perf_counter() - start) * 1000:.0f} ms")
+    index = chip_index()
+    wrong = 0
+    for hue, value, chroma in index.coords:
+        rgb = table.cell(hue, value, chroma)
+        h, v, c = rgb_to_munsell(rgb)
+        wrong += (v, c) != (value, chroma) or (chroma and h != hue)
+    print(f"  chips not inverting to themselves: {wrong}")
+    colors = random_colors()
+    coords = [rgb_to_munsell(rgb) for rgb in colors]
+    errors = sorted(delta_e(rgb, munsell_interpolate_float(*m)[0]) for rgb, m in zip(colors, coords))
+    print(f"  CIELAB error of forward(inverse(rgb)) over {len(colors)} random colors: "
+          f"median {errors[len(errors) // 2]:.2f}  90th percentile {errors[len(errors) * 9 // 10]:.2f}")
+    difference = np.abs(rgb_to_munsell_batch(np.array(colors)) - np.array(coords))
+    difference[:, 0] = np.minimum(difference[:, 0], table.hues - difference[:, 0])
+    disagree = int((difference.max(axis=1) > 1e-9).sum())
+    print(f"  colors where rgb_to_munsell_batch and rgb_to_munsell disagree: {disagree}")
+    scalar = 1e6 / calls_per_second(rgb_to_munsell, [(rgb,) for rgb in colors])
+    print(f"  rgb_to_munsell {scalar:.0f} us/color")
+    start = time.perf_counter()
+    ChipGrid(np.array(index.labs))
+    print(f"  chip grid for rgb_to_munsell_batch built in {(time.perf_counter() - start) * 1000:.0f} ms")
+    labs = np.array(index.labs)
+    for count in (1000, 10000, 100000):
+        block = np.random.default_rng(count).random((count, 3))
+        batch = 1e6 / (calls_per_second(rgb_to_munsell_batch, [(block,)], 0.3) * count)
+        brute = 1e6 / (calls_per_second(_nearest_brute, [(labs, _lab_batch(block), NEIGHBOURS)], 0.3) * count)
+        print(f"  {count:6d} colors: rgb_to_munsell_batch {batch:.2f} us/color, "
+              f"brute-force nearest chips alone {brute:.1f} us/color")
+    if wrong:
+        sys.exit("rgb_to_munsell does not invert the charted chips")
+    if disagree:
+        sys.exit("rgb_to_munsell_batch does not match rgb_to_munsell")
+
+
+def bench_solve(steps=17):
+    """Fails if solve_munsell_batch and solve_munsell disagree over a grid of the sRGB cube"""
+    import numpy as np
+    from MunsellColorPicker.MunsellInverse import solve_munsell, solve_munsell_batch
+    from MunsellColorPicker.MunsellTable import get_table
+    levels = [n / (steps - 1) for n in range(steps)]
+    colors = [(r, g, b) for r in levels for g in levels for b in levels]
+    start = time.perf_counter()
+    scalar = [solve_munsell(rgb) for rgb in colors]
+    scalar_rate = len(colors) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    coords, residual, converged, iterations = solve_munsell_batch(np.array(colors))
+    batch_rate = len(colors) / (time.perf_counter() - start)
+    counts = [s[3] for s in scalar]
+    print(f"solve_munsell over {len(colors)} colors of the sRGB cube: {scalar_rate:.0f} solves/s, "
+          f"solve_munsell_batch {batch_rate:.0f} solves/s")
+    print(f"  converged {sum(s[2] for s in scalar)}  iterations per solve: mean {sum(counts) / len(counts):.2f}  "
+          f"median {sorted(counts)[len(counts) // 2]}  max {max(counts)}")
+    print(f"  largest residual left, outside the charted solid: {max(s[1] for s in scalar) * 255:.2f} 8-bit steps")
+    difference = np.abs(np.array([s[0] for s in scalar]) - coords)
+    difference[:, 0] = np.minimum(difference[:, 0], get_table().hues - difference[:, 0])
+    disagree = int(((difference.max(axis=1) > 1e-9) | (np.array([s[2] for s in scalar]) != converged)).sum())
+    print(f"  colors where batch and scalar disagree: {disagree}")
+    if disagree:
+        sys.exit("solve_munsell_batch does not match solve_munsell")
+
+
+def bench_inverse_lattice():
+    """Fails if the mapped file or the batch lookup differ from the lattice they came from"""
+    import tempfile
+    import numpy as np
+    from MunsellColorPicker.MunsellInterpolate import munsell_interpolate_float
+    from MunsellColorPicker.MunsellInverse import solve_munsell
+    from MunsellColorPicker.MunsellInverseLattice import (
+        build_inverse_lattice, map_inverse_lattice, write_inverse_lattice,
+    )
+    start = time.perf_counter()
+    lattice = build_inverse_lattice()
+    built = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'MunsellInverse.bin')
+        write_inverse_lattice(path, lattice)
+        start = time.perf_counter()
+        mapped = map_inverse_lattice(path)
+        loaded = time.perf_counter() - start
+        print(f"inverse lattice {lattice.size}^3, {os.path.getsize(path)} bytes: built in {built:.1f} s, "
+              f"mapped in {loaded * 1000:.2f} ms")
+        colors = random_colors()
+        scalar = [lattice.lookup(rgb) for rgb in colors]
+        differ = sum(mapped.lookup(rgb) != m for rgb, m in zip(colors, scalar))
+        batch = mapped.lookup_batch(np.array(colors))
+        del mapped
+    hues = lattice.hues
+    difference = np.abs(batch - np.array(scalar))
+    difference[:, 0] = np.minimum(difference[:, 0], hues - difference[:, 0])
+    mismatched = int((difference.max(axis=1) > 1e-9).sum())
+    print(f"  mapped lookups differing from memory: {differ}  batch lookups differing from scalar: {mismatched}")
+    solved = [solve_munsell(rgb)[0] for rgb in colors[:1000]]
+    for name, coords in (('solve_munsell', solved), ('lattice', scalar[:1000])):
+        errors = sorted(delta_e(rgb, munsell_interpolate_float(*m)[0]) for rgb, m in zip(colors, coords))
+        print(f"  CIELAB error of forward({name}(rgb)) over 1000 colors: median {errors[500]:.3f}  "
+              f"90th percentile {errors[900]:.3f}  max {errors[-1]:.2f}")
+    lookup = 1e6 / calls_per_second(lattice.lookup, [(rgb,) for rgb in colors])
+    batch_lookup = 1e6 / (calls_per_second(lattice.lookup_batch, [(np.array(colors),)]) * len(colors))
+    print(f"  lookup {lookup:.1f} us/color, lookup_batch {batch_lookup:.2f} us/color")
+    if differ or mismatched:
+        sys.exit("inverse lattice lookups are inconsistent")
+    bench_inverse_lattice_switch()
+
+
+def bench_inverse_lattice_switch():
+    """Fails if a dataset switch writes over the shipped file or leaves no cached lattice"""
+    import hashlib
+    import tempfile
+    from MunsellColorPicker.MunsellInverseLattice import INVERSE_LATTICE_FILE, load_inverse_lattice
+    from MunsellColorPicker.MunsellLoader import cached_file
+    from MunsellColorPicker.MunsellTable import (
+        current_dataset, get_table, register_dataset, table_from_nested, use_dataset,
+    )
+
+    def digest():
+        with open(INVERSE_LATTICE_FILE, 'rb') as f:
+            return hashlib.md5(f.read()).hexdigest()
+
+    shipped = digest()
+    dataset = current_dataset()
+    table = get_table()
+    register_dataset('dimmed', table_from_nested(
+        [[[[x * 0.99 for x in table[h][v][c]] for c in range(table.chromas)] for v in range(table.values)]
+         for h in range(table.hues)]))
+    with tempfile.TemporaryDirectory() as directory:
+        use_dataset('dimmed')
+        try:
+            start = time.perf_counter()
+            load_inverse_lattice(cache_dir=directory)
+            built = time.perf_counter() - start
+            cached = os.path.exists(cached_file(INVERSE_LATTICE_FILE, get_table().checksum, directory))
+            start = time.perf_counter()
+            load_inverse_lattice(cache_dir=directory)
+            reloaded = time.perf_counter() - start
+        finally:
+            use_dataset(dataset)
+        start = time.perf_counter()
+        back = load_inverse_lattice(cache_dir=directory).checksum == get_table().checksum
+        returned = time.perf_counter() - start
+        files = len(os.listdir(directory))
+    untouched = digest() == shipped
+    print(f"  switching to another dataset: built in {built:.1f} s, {'cached' if cached else 'NOT cached'}, "
+          f"loaded again in {reloaded * 1000:.2f} ms; shipped file {'untouched' if untouched else 'CHANGED'}, "
+          f"switching back loads it in {returned * 1000:.2f} ms, {files} file cached")
+    if not (cached and untouched and back and files == 1):
+        sys.exit("a dataset switch wrote over the shipped inverse lattice or cached nothing")
+
+
+def bench_notation():
+    """Fails unless every charted chip round-trips through Munsell notation, scalar and batch"""
+    from MunsellColorPicker.MunsellNotation import (
+        format_munsell, format_munsell_batch, parse_munsell, parse_munsell_batch,
+    )
+    from MunsellColorPicker.MunsellTable import get_table
+    table = get_table()
+    chips = [(float(h), float(v), float(c)) for h, v, c, _ in table.chips()]
+    names = [format_munsell(*c) for c in chips]
+    # Greys are the same chip under every hue and parse back to hue 0.
+    expected = [(h if c else 0.0, v, c) for h, v, c in chips]
+    wrong = sum(parse_munsell(name) != coords for name, coords in zip(names, expected))
+    wrong_batch = (format_munsell_batch(chips) != names) + (parse_munsell_batch(names) != expected)
+    print(f"notation of {len(chips)} charted chips, e.g. {names[len(names) // 3]!r} and {names[0]!r}: "
+          f"{wrong} fail to round-trip, batch forms {'differ' if wrong_batch else 'agree'}")
+    points = gamut_points(20000)
+    formatted = [format_munsell(*p) for p in points]
+    unstable = sum(format_munsell(*parse_munsell(name)) != name for name in formatted)
+    differ = sum(a != b for a, b in zip(format_munsell_batch(points), formatted))
+    differ += sum(a != parse_munsell(name) for a, name in zip(parse_munsell_batch(formatted), formatted))
+    print(f"  over {len(points)} fractional points: {unstable} change on reformatting, "
+          f"{differ} batch formats or parses differ")
+    palette = formatted[:5000]
+    rates = {
+        'format_munsell': calls_per_second(format_munsell, points[:5000]),
+        'format_munsell_batch': calls_per_second(format_munsell_batch, [(points[:5000],)]) * 5000,
+        'parse_munsell': calls_per_second(parse_munsell, [(name,) for name in palette]),
+        'parse_munsell_batch': calls_per_second(parse_munsell_batch, [(palette,)]) * 5000,
+    }
+    print("  " + "  ".join(f"{name} {rate:.0f}/s" for name, rate in rates.items()))
+    accepted = []
+    for name in ('5R 5/', '5R5', '2.5YR 6/', 'N 5/2', '11R 5/2', '5X 5/2', ''):
+        for parse in (parse_munsell, lambda text: parse_munsell_batch([text])):
+            try:
+                parse(name)
+            except ValueError:
+                continue
+            accepted.append(name)
+    print(f"  malformed notations accepted: {accepted or 'none'}")
+    if wrong or wrong_batch or unstable or differ:
+        sys.exit("Munsell notation does not round-trip")
+    if accepted:
+        sys.exit("parse_munsell accepts malformed notation")
+
+
+SECTIONS = {
+    'import': bench_import,
+    'mmap': bench_mmap,
+    'startup': bench_startup,
+    'sweep': bench_sweep,
+    'kernel': bench_kernel,
+    'exists': bench_exists,
+    'fixed': bench_fixed,
+    'batch': bench_batch,
+    'cache': bench_cache,
+    'lattice': bench_lattice,
+    'tetrahedral': bench_tetrahedral,
+    'coverage': bench_coverage,
+    'pixels': bench_pixels,
+    'swatch': bench_swatch,
+    'jacobian': bench_jacobian,
+    'inverse': bench_inverse,
+    'solve': bench_solve,
+    'inverse_lattice': bench_inverse_lattice,
+    'notation': bench_notation,
+}
+
+
+def main(argv):
+    names = argv[1:] or list(SECTIONS)
+    for name in names:
+        SECTIONS[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
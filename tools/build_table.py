@@ -0,0 +1,267 @@
+"""Build the Munsell table files from source data.
+
+Usage:
+    python tools/build_table.py [--source FILE] [--format FORMAT ...] [--output-dir DIR]
+    python tools/build_table.py --check
+
+The source is either a renotation-style text file, one chip per line as
+"H V C x y Y" (for example "2.5R 5 8 0.3921 0.3280 19.77", Y on the 0-100
+scale, illuminant C), or, by default, the MunsellFloats.py literal.
+
+Formats:
+    binary     MunsellTable.bin, the sparse table the plugin loads. Its
+               data is 8 byte aligned, so the same file is read into
+               memory or memory-mapped.
+    quantized  MunsellTable16.bin, the same table as uint16 fixed point
+               for munsell_interpolate_fixed, at half the size.
+    literal    MunsellFloats.py, the nested list the plugin falls back to.
+    lattice    MunsellLattice.bin, munsell_interpolate sampled 4x finer in
+               hue and value and 2x in chroma for the "nearest" mode.
+               Without it, or for another table, the plugin builds the
+               lattice in the background and caches it per table
+               checksum in the user cache directory.
+    inverse    MunsellInverse.bin, solve_munsell sampled on a 33^3 grid
+               over the sRGB cube for rgb_to_munsell_lattice. It ships
+               with the plugin and is memory-mapped when it matches the
+               table. For any other table the plugin builds it in the
+               background and caches it per table checksum in the user
+               cache directory, leaving the shipped file alone.
+
+Every output carries the content checksum of the table, which only
+depends on the data, so the same source always gives the same files.
+--check rebuilds from the literal and fails if the literal's CHECKSUM
+stamp does not match its data, the shipped binary does not match it or
+the shipped inverse lattice came from another table.
+"""
+import argparse
+import math
+import os
+import re
+import sys
+
+import _plugin
+
+_plugin.load()
+
+from MunsellColorPicker.MunsellInverseLattice import (
+    INVERSE_LATTICE_FILE, build_inverse_lattice, read_inverse_lattice, write_inverse_lattice,
+)
+from MunsellColorPicker.MunsellLattice import build_lattice, write_lattice
+from MunsellColorPicker.MunsellNotation import HUE_FAMILIES, VALUE_STEPS
+from MunsellColorPicker.MunsellTable import (
+    NaN, TABLE_FILE, quantize_table, read_table, register_dataset, table_from_nested, use_dataset,
+    write_table,
+)
+
+LITERAL_FILE = os.path.join(_plugin.PLUGIN_DIR, 'MunsellFloats.py')
+
+TABLE_VALUES = 16
+TABLE_CHROMAS = 27
+HUES = 40
+
+# Bradford adaptation from illuminant C to D65, then XYZ to linear sRGB.
+C_TO_D65 = [
+    [0.9904476, -0.0071683, -0.0116156],
+    [-0.0123712, 1.0155950, -0.0029282],
+    [-0.0035635, 0.0067697, 0.9181569],
+]
+XYZ_TO_SRGB = [
+    [3.2404542, -1.5371385, -0.4985314],
+    [-0.9692660, 1.8760108, 0.0415560],
+    [0.0556434, -0.2040259, 1.0572252],
+]
+ILLUMINANT_C = (0.31006, 0.31616)
+
+
+def hue_index(name):
+    """Table hue index of a hue like '2.5R' (0) or '10RP' (39)"""
+    match = re.fullmatch(r'([0-9.]+)([A-Z]+)', name)
+    if not match or match.group(2) not in HUE_FAMILIES:
+        raise ValueError(f"bad hue {name!r}")
+    step = float(match.group(1)) / 2.5
+    if step != int(step) or not 1 <= step <= 4:
+        raise ValueError(f"hue {name!r} is not on the 2.5 step grid")
+    return HUE_FAMILIES.index(match.group(2)) * 4 + int(step) - 1
+
+
+def value_index(value):
+    if value not in VALUE_STEPS:
+        raise ValueError(f"value {value} is not a table value")
+    return VALUE_STEPS.index(value)
+
+
+def munsell_value_to_y(value):
+    """ASTM D1535 luminance factor (0-100) of a Munsell value"""
+    v = value
+    return 1.1914 * v - 0.22533 * v ** 2 + 0.23352 * v ** 3 - 0.020484 * v ** 4 + 0.00081939 * v ** 5
+
+
+def mat_vec(m, v):
+    return [sum(m[r][c] * v[c] for c in range(3)) for r in range(3)]
+
+
+def srgb_encode(linear):
+    # Out of gamut chips keep their sign so interpolation can see them.
+    sign = -1 if linear < 0 else 1
+    linear = abs(linear)
+    if linear <= 0.0031308:
+        return sign * 12.92 * linear
+    return sign * (1.055 * linear ** (1 / 2.4) - 0.055)
+
+
+def xyy_to_srgb(x, y, big_y):
+    if big_y == 0:
+        return [0.0, 0.0, 0.0]
+    big_y /= 100.0
+    xyz = [x * big_y / y, big_y, (1 - x - y) * big_y / y]
+    linear = mat_vec(XYZ_TO_SRGB, mat_vec(C_TO_D65, xyz))
+    return [round(srgb_encode(c), 5) for c in linear]
+
+
+def read_renotation(path):
+    """Nested Munsell[h][v][c] list from a renotation-style text file"""
+    nested = [[[[NaN, NaN, NaN] for _ in range(TABLE_CHROMAS)] for _ in range(TABLE_VALUES)]
+              for _ in range(HUES)]
+    # Chroma 0 is the neutral grey of each value under illuminant C.
+    for j, value in enumerate(VALUE_STEPS):
+        grey = xyy_to_srgb(*ILLUMINANT_C, munsell_value_to_y(value))
+        for i in range(HUES):
+            nested[i][j][0] = grey
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            fields = line.split()
+            if len(fields) != 6 or fields[0][0] not in '0123456789':
+                continue  # header or blank line
+            try:
+                i = hue_index(fields[0])
+                j = value_index(float(fields[1]))
+                chroma = float(fields[2])
+                x, y, big_y = map(float, fields[3:])
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: {e}") from None
+            if chroma % 2 or not 0 < chroma < 2 * TABLE_CHROMAS:
+                continue  # the table holds even chromas only
+            nested[i][j][int(chroma) // 2] = xyy_to_srgb(x, y, big_y)
+    return nested
+
+
+def read_literal_namespace(path=LITERAL_FILE):
+    namespace = {}
+    with open(path) as f:
+        exec(compile(f.read(), path, 'exec'), namespace)
+    return namespace
+
+
+def read_literal(path=LITERAL_FILE):
+    return read_literal_namespace(path)['Munsell']
+
+
+def format_literal(table):
+    def number(x):
+        return 'NaN' if math.isnan(x) else repr(x)
+
+    lines = ["NaN = float('nan')",
+             f"CHECKSUM = '{table.checksum}'",
+             "#Munsell floats in current python file",
+             "Munsell = ["]
+    for i in range(table.hues):
+        lines.append("  [")
+        for j in range(table.values):
+            lines.append("    [")
+            for k in range(table.chromas):
+                triple = ', '.join(number(x) for x in table.cell(i, j, k))
+                lines.append(f"      [{triple}]" + (',' if k < table.chromas - 1 else ''))
+            lines.append("    ]" + (',' if j < table.values - 1 else ''))
+        lines.append("  ]" + (',' if i < table.hues - 1 else ''))
+    lines.append("]")
+    return '\n'.join(lines)
+
+
+def write_binary(path, table):
+    write_table(path, table)
+    return table
+
+
+def write_quantized(path, table):
+    quantized = quantize_table(table)
+    write_table(path, quantized)
+    return quantized
+
+
+def write_literal(path, table):
+    with open(path, 'w') as f:
+        f.write(format_literal(table))
+    return table
+
+
+def write_lattice_file(path, table):
+    # The engine samples the current dataset, so make the new table current.
+    register_dataset('build', table)
+    use_dataset('build')
+    lattice = build_lattice()
+    write_lattice(path, lattice)
+    return lattice
+
+
+def write_inverse_file(path, table):
+    register_dataset('build', table)
+    use_dataset('build')
+    lattice = build_inverse_lattice()
+    write_inverse_lattice(path, lattice)
+    return lattice
+
+
+FORMATS = {
+    'binary': ('MunsellTable.bin', write_binary),
+    'quantized': ('MunsellTable16.bin', write_quantized),
+    'literal': ('MunsellFloats.py', write_literal),
+    'lattice': ('MunsellLattice.bin', write_lattice_file),
+    'inverse': ('MunsellInverse.bin', write_inverse_file),
+}
+
+
+def check():
+    literal = read_literal_namespace()
+    source = table_from_nested(literal['Munsell'])
+    stamp = literal.get('CHECKSUM', 'missing')
+    print(f"literal stamp {stamp}  data {source.checksum}")
+    if stamp != source.checksum:
+        sys.exit("the CHECKSUM in MunsellFloats.py does not match its data, rebuild it with "
+                 "tools/build_table.py --format literal")
+    shipped = read_table(TABLE_FILE)
+    same = (bytes(shipped.runs) == bytes(source.runs)
+            and list(shipped.data) == list(source.data))
+    print(f"literal {source.checksum}  binary {shipped.checksum}  data {'matches' if same else 'DIFFERS'}")
+    if shipped.checksum != source.checksum or not same:
+        sys.exit("MunsellTable.bin is out of date, rebuild it with tools/build_table.py")
+    try:
+        inverse = read_inverse_lattice(INVERSE_LATTICE_FILE).checksum
+    except (FileNotFoundError, ValueError):
+        inverse = 'missing'
+    print(f"inverse lattice {inverse}")
+    if inverse != source.checksum:
+        sys.exit("MunsellInverse.bin is out of date, rebuild it with tools/build_table.py --format inverse")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--source', help="renotation-style text file (default: the MunsellFloats.py literal)")
+    parser.add_argument('--format', nargs='+', choices=sorted(FORMATS), default=['binary'])
+    parser.add_argument('--output-dir', default=_plugin.PLUGIN_DIR)
+    parser.add_argument('--check', action='store_true', help="verify the shipped binary against the literal")
+    args = parser.parse_args(argv[1:])
+    if args.check:
+        check()
+        return
+    nested = read_renotation(args.source) if args.source else read_literal()
+    table = table_from_nested(nested)
+    for name in args.format:
+        filename, writer = FORMATS[name]
+        path = os.path.join(args.output_dir, filename)
+        written = writer(path, table)
+        print(f"wrote {path} ({name}, checksum {written.checksum}): {table.hues} hues x {table.values} "
+              f"values x {table.chromas} chromas, {table.size} charted")
+
+
+if __name__ == '__main__':
+    main(sys.argv)